@@ -0,0 +1,133 @@
+"""Translation of whole program to Python module, used by `--emit-python` and `--aot`
+
+Every basic block (see `cfg`) is compiled in advance by the same code
+generator as hot blocks (see `jit`), so no instruction is dispatched on its
+own. Decoded program is stored in the module as pickle and instructions
+without inlined code are run by their methods in `Program`, so translated
+program gives the same output, errors and statistics as interpreted one.
+Module runs with the same arguments as interpret.py except those selecting
+the source. It imports the interpreter from the directory it was translated
+by and refuses to run if the interpreter has changed since, see `header`.
+"""
+import os
+import pickle
+import types
+
+from cache import TRANSLATOR_MODULES, interpreter_version
+from cfg import ControlFlowGraph
+from jit import BlockCompiler, type_names
+
+# start of translated module, the pickled program and handlers are only valid
+# for the same version of the interpreter
+header = '''"""IPPcode20 program translated to Python by `aot`
+
+Run it with the same arguments as interpret.py except --source, --stream
+and --optimize. The interpreter is imported from {directory}
+"""
+import pickle
+import sys
+
+if {directory!r} not in sys.path:
+    sys.path.insert(0, {directory!r})
+
+from cache import TRANSLATOR_MODULES, interpreter_version
+from error import InternalError, eprint
+from var import *
+from var import _small_ints as small
+from interpret import Program, main
+
+# version of the interpreter which translated the program, see `cache.interpreter_version`
+VERSION = {version!r}
+if interpreter_version(TRANSLATOR_MODULES) != VERSION:
+    eprint("Program was translated by another version of the interpreter, translate it again")
+    InternalError().exit()
+'''
+
+
+class ModuleTranslator:
+    """Generates source of module, objects used by blocks are its global variables"""
+    def __init__(self, code, handlers: list):
+        self.code = code
+        self.handlers = handlers
+        # global name of every object used by generated code, by its id
+        self.names = {}
+        self.definitions = []
+        # where constant operands are stored in decoded program
+        self.constants = {}
+        for index, instr in enumerate(code.instructions):
+            for position, (arg_type, value) in enumerate(instr.args):
+                if arg_type not in ("var", "label", "type", "opcode"):
+                    self.constants.setdefault(id(value), (index, position))
+
+    def name(self, value) -> str:
+        """Returns global name of handler or constant operand, it is defined on first use"""
+        name = self.names.get(id(value))
+        if name is not None:
+            return name
+        if callable(value):
+            name = "op_" + value.__name__
+            definition = "Program." + value.__name__
+        else:
+            name = "k" + str(len(self.names))
+            definition = "instructions[{}].args[{}][1]".format(*self.constants[id(value)])
+        self.names[id(value)] = name
+        self.definitions.append(name + " = " + definition)
+        return name
+
+    def translate(self) -> str:
+        graph = ControlFlowGraph(self.code.instructions)
+        functions = [ModuleCompiler(block, self).source("block_" + str(block.start)) for block in graph.blocks()]
+
+        lines = [header.format(directory=os.path.dirname(os.path.abspath(__file__)),
+                               version=interpreter_version(TRANSLATOR_MODULES))]
+        lines += [name + " = VarType." + name for name in type_names.values()]
+        lines += ["TRUE = Var.TRUE", "FALSE = Var.FALSE", ""]
+        lines.append("code = pickle.loads(" + repr(pickle.dumps(self.code, protocol=pickle.HIGHEST_PROTOCOL)) + ")")
+        lines.append("instructions = code.instructions")
+        lines += self.definitions
+        # two blank lines around functions, their sources end with a newline
+        for function in functions:
+            lines += ["", "", function.rstrip("\n")]
+        lines += ["", "",
+                  "# functions of blocks by their start",
+                  "blocks = {" + ", ".join("{0}: block_{0}".format(start) for start in graph.sorted_starts) + "}",
+                  "",
+                  'if __name__ == "__main__":',
+                  "    main(code, blocks)",
+                  ""]
+        return "\n".join(lines)
+
+
+class ModuleCompiler(BlockCompiler):
+    """Compiles block to function of translated module
+
+    Statistics are not known until the module is run, so loops check them
+    at runtime.
+    """
+    def __init__(self, block, translator: ModuleTranslator):
+        super().__init__(block, translator.handlers, None)
+        self.translator = translator
+
+    def name(self, value) -> str:
+        return self.translator.name(value)
+
+    def preamble(self):
+        super().preamble()
+        if self.loop:
+            self.emit("stats = program.stats")
+
+    def count(self):
+        self.emit("if stats is not None:")
+        self.emit("    stats.insts += " + str(self.block.weight))
+
+
+def translate(code, handlers: list) -> str:
+    """Returns source of module with program `code`, `handlers` are methods of instructions by opcode id"""
+    return ModuleTranslator(code, handlers).translate()
+
+
+def load(source: str):
+    """Runs source of translated module, returns the module"""
+    module = types.ModuleType("translated")
+    exec(compile(source, "<translated>", "exec"), module.__dict__)
+    return module
@@ -0,0 +1,157 @@
+"""Benchmark runner for interpret.py
+
+Every `*.xml` program in benchmark directory is interpreted several times
+(with `*.in` file as input, if there is one, and without cache of decoded
+programs) and the best time is compared to baseline stored in
+`baseline.json` in the same directory. Startup with warm cache is measured
+by startup.py. Large programs and inputs are not stored in the repository,
+they are generated into the default benchmark directory, see `generated`.
+"""
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+from benchmark import BenchmarkOpts, Baseline, best_time, common_arg_types, parse_args
+
+arg_types = {
+    **common_arg_types,
+    "directory": True,
+    "match": True,
+}
+
+help_strings = [
+    "IPPcode20 interpreter benchmark (bench.py)\n",
+    "Parameters:",
+    "--help              - Prints script manual, exclusive with other arguments",
+    "--directory=PATH    - Directory with benchmark programs, default is bench",
+    "--int-script=PATH   - Path to interpreter, default is interpret.py",
+    "--repeat=N          - Number of runs of each program, best time is used, default is 5",
+    "--threshold=PERCENT - Slowdown against baseline reported as regression, default is 10",
+    "--match=REGEX       - Only run programs with matching name",
+    "--update            - Store measured times as new baseline\n",
+    "Return codes:",
+    " 0 - Success, no regressions",
+    " 1 - Some benchmark is slower than baseline or failed",
+    "10 - Invalid argument or combination of arguments",
+]
+
+
+class BenchOpts(BenchmarkOpts):
+    def __init__(self):
+        super().__init__(repeat=5)
+        self.directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench")
+        self.match = None
+
+
+def parse_arg(opts: BenchOpts, name: str, value: str):
+    if name == "directory":
+        opts.directory = value
+    elif name == "match":
+        opts.match = re.compile(value)
+
+
+def instruction(order: int, opcode: str, *args) -> str:
+    lines = ['  <instruction order="{}" opcode="{}">'.format(order, opcode)]
+    for position, (arg_type, value) in enumerate(args, 1):
+        lines.append('    <arg{0} type="{1}">{2}</arg{0}>'.format(position, arg_type, value))
+    lines.append("  </instruction>")
+    return "\n".join(lines)
+
+
+def generate_load() -> str:
+    """Long program without loops, its run time is mostly decoding"""
+    instructions = [("DEFVAR", ("var", "GF@a")), ("DEFVAR", ("var", "GF@s")), ("DEFVAR", ("var", "GF@b")),
+                    ("MOVE", ("var", "GF@a"), ("int", "0")), ("MOVE", ("var", "GF@s"), ("string", "x"))]
+    for i in range(1, 2000):
+        label = "l" + str(i)
+        instructions += [("ADD", ("var", "GF@a"), ("var", "GF@a"), ("int", str(i % 7))),
+                         ("CONCAT", ("var", "GF@s"), ("string", "ab\\032c"), ("string", "d")),
+                         ("LT", ("var", "GF@b"), ("var", "GF@a"), ("int", "100")),
+                         ("JUMPIFEQ", ("label", label), ("var", "GF@b"), ("bool", "true")),
+                         ("LABEL", ("label", label))]
+    instructions.append(("WRITE", ("var", "GF@a")))
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<program language="IPPcode20">']
+    lines += [instruction(order, *instr) for order, instr in enumerate(instructions, 1)]
+    lines.append("</program>")
+    return "\n".join(lines) + "\n"
+
+
+def generate_read() -> str:
+    """Numbers summed by `read.xml`"""
+    return "".join(str(i) + "\n" for i in range(1, 50001))
+
+
+def generate_escapes() -> str:
+    """Two lines of 2 MB for `escapes.xml`, the first with escape sequences and the second without"""
+    words = ["line", "tab", "text", "escape", "IPPcode20", "a"]
+    escapes = ["\\092", "\\032", "\\009", "\\010"]
+    generator = random.Random(0)
+    lines = []
+    for pieces in (words + escapes, words):
+        line = []
+        length = 0
+        while length < 2000000:
+            piece = generator.choice(pieces)
+            line.append(piece)
+            length += len(piece)
+        lines.append("".join(line) + "\n")
+    return "".join(lines)
+
+
+# files of the default benchmark directory generated when they are missing, by name
+generated = {
+    "load.xml": generate_load,
+    "read.in": generate_read,
+    "escapes.in": generate_escapes,
+}
+
+
+def generate_files(directory: str):
+    for name, generate in generated.items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            with open(path, "w") as file:
+                file.write(generate())
+
+
+def run_benchmark(opts: BenchOpts, source: str) -> float:
+    """Returns best wall time of `repeat` runs, `None` if program failed"""
+    input_path = source[:-len(".xml")] + ".in"
+    if not os.path.isfile(input_path):
+        input_path = os.devnull
+
+    def measure():
+        start = time.perf_counter()
+        result = subprocess.run(
+            # decoding is measured too (see `load.xml`) and nothing is written to cache of the user
+            [sys.executable, opts.interpret, "--source=" + source, "--input=" + input_path, "--no-cache"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        elapsed = time.perf_counter() - start
+        return elapsed if result.returncode == 0 else None
+
+    return best_time(measure, opts.repeat)
+
+
+def main():
+    opts = parse_args(BenchOpts(), arg_types, help_strings, parse_arg)
+    if not os.path.isdir(opts.directory):
+        exit(10)
+    if os.path.samefile(opts.directory, BenchOpts().directory):
+        generate_files(opts.directory)
+    baseline = Baseline(os.path.join(opts.directory, "baseline.json"), opts, "benchmark", "s", 3)
+
+    names = sorted(f[:-len(".xml")] for f in os.listdir(opts.directory) if f.endswith(".xml"))
+    if opts.match is not None:
+        names = [name for name in names if opts.match.search(name)]
+
+    for name in names:
+        baseline.report(name, run_benchmark(opts, os.path.join(opts.directory, name + ".xml")))
+    baseline.finish()
+
+
+if __name__ == "__main__":
+    main()
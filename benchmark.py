@@ -0,0 +1,129 @@
+"""Code shared by benchmark scripts bench.py and startup.py
+
+Both scripts take the same basic parameters, measure the best time of
+several runs and compare it to baseline stored in JSON file.
+"""
+import json
+import os
+import re
+import sys
+
+# parameters of every benchmark script, `True` if they take a value
+common_arg_types = {
+    "help": False,
+    "int-script": True,
+    "repeat": True,
+    "threshold": True,
+    "update": False,
+}
+
+
+class BenchmarkOpts:
+    def __init__(self, repeat: int):
+        self.interpret = os.path.join(os.path.dirname(os.path.abspath(__file__)), "interpret.py")
+        self.repeat = repeat
+        self.threshold = 10.0
+        self.update = False
+
+
+def parse_args(opts: BenchmarkOpts, arg_types: dict, help_strings: list, parse_arg=None) -> BenchmarkOpts:
+    """Fills `opts` from command line, exits with 10 on invalid argument
+
+    Parameters from `arg_types` which are not common to all scripts are
+    passed to `parse_arg(opts, name, value)`, which can raise `ValueError`
+    or `re.error` for invalid value.
+    """
+    args = sys.argv[1:]
+    arg_format = re.compile(r'^--?([a-zA-Z-]+)(?:$|=([\S]+))$')
+
+    for arg in args:
+        try:
+            name, value = arg_format.findall(arg)[0]
+        except IndexError:
+            exit(10)
+            return
+
+        if name not in arg_types or arg_types[name] != (len(value) != 0):
+            exit(10)
+
+        try:
+            if name == "help":
+                if len(args) != 1:
+                    exit(10)
+                print("\n".join(help_strings))
+                exit(0)
+            elif name == "int-script":
+                opts.interpret = value
+            elif name == "repeat":
+                opts.repeat = int(value)
+                if opts.repeat < 1:
+                    exit(10)
+            elif name == "threshold":
+                opts.threshold = float(value)
+            elif name == "update":
+                opts.update = True
+            else:
+                parse_arg(opts, name, value)
+        except (ValueError, re.error):
+            exit(10)
+
+    if not os.path.isfile(opts.interpret):
+        exit(10)
+    return opts
+
+
+def best_time(measure, repeat: int) -> float:
+    """Returns best result of `repeat` calls of `measure`, `None` if any of them failed"""
+    best = None
+    for _ in range(repeat):
+        elapsed = measure()
+        if elapsed is None:
+            return None
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+class Baseline:
+    """Times stored in JSON file by name, measured times are compared to them and printed as table"""
+    def __init__(self, path: str, opts: BenchmarkOpts, title: str, unit: str, decimals: int):
+        self.path = path
+        self.opts = opts
+        self.decimals = decimals
+        # whether some benchmark failed or is slower than baseline
+        self.failed = False
+        try:
+            with open(path) as file:
+                self.times = json.load(file)
+        except FileNotFoundError:
+            self.times = {}
+        print("{:<16} {:>10} {:>10} {:>8}".format(title, "time [{}]".format(unit), "base [{}]".format(unit),
+                                                   "change"))
+
+    def report(self, name: str, elapsed: float):
+        """Prints row of benchmark, `elapsed` is `None` if it failed"""
+        if elapsed is None:
+            print("{:<16} {:>10}".format(name, "FAILED"))
+            self.failed = True
+            return
+
+        time_format = "{:>10." + str(self.decimals) + "f}"
+        if name in self.times:
+            change = (elapsed / self.times[name] - 1) * 100
+            regression = change > self.opts.threshold
+            self.failed = self.failed or regression
+            print(("{:<16} " + time_format + " " + time_format + " {:>+7.1f}%{}").format(
+                name, elapsed, self.times[name], change, "  REGRESSION" if regression else ""))
+        else:
+            print(("{:<16} " + time_format + " {:>10} {:>8}").format(name, elapsed, "-", "-"))
+
+        if self.opts.update:
+            self.times[name] = round(elapsed, self.decimals + 1)
+
+    def finish(self):
+        """Stores new baseline if requested and exits, 1 if some benchmark failed or regressed"""
+        if self.opts.update:
+            with open(self.path, "w") as file:
+                json.dump(self.times, file, indent=2, sort_keys=True)
+                file.write("\n")
+        exit(1 if self.failed else 0)
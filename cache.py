@@ -0,0 +1,160 @@
+import gc
+import hashlib
+import os
+import pickle
+import stat
+import sys
+from functools import lru_cache
+
+from instruction import Code
+
+# modules which affect decoded program, any change in them invalidates cached programs
+DECODER_MODULES = ("cache.py", "error.py", "helper.py", "instruction.py", "parse.py", "var.py")
+# modules which affect programs translated by `aot`
+TRANSLATOR_MODULES = DECODER_MODULES + ("aot.py", "cfg.py", "interpret.py", "jit.py", "peephole.py", "simplify.py")
+
+
+@lru_cache(maxsize=2)
+def interpreter_version(modules: tuple = DECODER_MODULES) -> str:
+    """Hash of python version and sources of `modules`, computed once per process"""
+    digest = hashlib.sha256(sys.version.encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        with open(os.path.join(directory, module), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class ProgramCache:
+    """Decoded programs stored on disk, keyed by hash of source and interpreter version
+
+    Cache is only an optimization, unreadable or damaged images are ignored
+    and program is decoded again. Only programs that were loaded without
+    error are stored. Cached programs are run, so directory which belongs to
+    another user or which others can write to is not used at all.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        # checked on first use, see `private`
+        self.checked = None
+
+    def private(self) -> bool:
+        """Whether directory belongs to current user and only the user can write to it, missing one is created"""
+        if self.checked is None:
+            try:
+                os.makedirs(self.directory, mode=0o700, exist_ok=True)
+                status = os.stat(self.directory)
+                self.checked = status.st_uid == os.getuid() and not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+            except OSError:
+                self.checked = False
+        return self.checked
+
+    def key(self, source: str) -> str:
+        digest = hashlib.sha256(interpreter_version().encode())
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".pickle")
+
+    def load(self, key: str):
+        """Returns cached `Code`, `None` if there is no valid image"""
+        if not self.private():
+            return None
+        # loading creates a lot of objects at once, garbage collection would only slow it down
+        gc.disable()
+        try:
+            with open(self.path(key), "rb") as file:
+                stored_key, code = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # damaged or incompatible image
+            self.remove(key)
+            return None
+        finally:
+            gc.enable()
+
+        if stored_key != key or not isinstance(code, Code):
+            self.remove(key)
+            return None
+        return code
+
+    def store(self, key: str, code: Code):
+        try:
+            data = pickle.dumps((key, code), protocol=pickle.HIGHEST_PROTOCOL)
+        except pickle.PicklingError:
+            return
+        self.write(self.path(key), data)
+
+    def module_key(self, source: str, optimize: bool) -> str:
+        """Key of program translated by `aot`, translation depends on more modules and on optimization"""
+        digest = hashlib.sha256(interpreter_version(TRANSLATOR_MODULES).encode())
+        digest.update(b"optimize" if optimize else b"plain")
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def module_path(self, key: str) -> str:
+        # name of module must be an identifier
+        return os.path.join(self.directory, "aot_" + key + ".py")
+
+    def load_module(self, key: str):
+        """Imports translated program, `None` if there is no valid module
+
+        Module is imported from its file, so its bytecode is cached by Python.
+        Module which doesn't end with its key (see `store_module`) is damaged
+        or foreign and is removed.
+        """
+        import importlib.util
+
+        path = self.module_path(key)
+        if not self.private() or not os.path.exists(path):
+            return None
+        spec = importlib.util.spec_from_file_location("aot_" + key, path)
+        module = importlib.util.module_from_spec(spec)
+        gc.disable()
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            self.remove_file(path)
+            return None
+        finally:
+            gc.enable()
+
+        if getattr(module, "CACHE_KEY", None) != key:
+            self.remove_file(path)
+            return None
+        return module
+
+    def store_module(self, key: str, source: str):
+        source += "# key of cache entry, checked when module is loaded\nCACHE_KEY = {!r}\n".format(key)
+        self.write(self.module_path(key), source.encode("utf-8"))
+
+    def write(self, path: str, data: bytes):
+        """Writes file through temporary file, so other processes never read incomplete one"""
+        import tempfile
+
+        if not self.private():
+            return
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(data)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError:
+            pass
+
+    def remove(self, key: str):
+        self.remove_file(self.path(key))
+
+    @staticmethod
+    def remove_file(path: str):
+        """Removes damaged file, it can already be removed or replaced by another process"""
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,201 @@
+"""Basic blocks and control flow graph of decoded program
+
+Block is a sequence of instructions which is always executed whole, from its
+first instruction to the last one. Block starts at the first instruction of
+program, at every `LABEL` and jump target and after every jump, `CALL`,
+`RETURN` and `EXIT`, only the last instruction of block can change order of
+execution. Interpreter runs whole blocks without checking `ip` between
+instructions, loops and functions are found on request for analysis.
+
+Superinstruction created by `peephole` is followed by the rest of its
+sequence, which is skipped, so instructions of block don't always have
+consecutive indices. If there is jump into the middle of sequence, block
+starting there overlaps the block with the superinstruction.
+"""
+from bisect import bisect_right
+
+# instructions which can continue elsewhere than with the next instruction
+BRANCHES = frozenset(("JUMP", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS", "CALL", "RETURN", "EXIT",
+                      "PUSHS+PUSHS+JUMPIFS", "COMPARE+JUMPIF"))
+
+
+def length(instr) -> int:
+    """Number of program indices taken by instruction, superinstruction takes its whole sequence"""
+    return instr.opcode.count("+") + 1
+
+
+def leaders(program: list) -> set:
+    """Returns indices of instructions which start basic block"""
+    starts = {0} if program else set()
+    for index, instr in enumerate(program):
+        if instr.opcode == "LABEL":
+            starts.add(index)
+        elif instr.opcode in BRANCHES:
+            starts.add(index + length(instr))
+            if instr.opcode not in ("RETURN", "EXIT"):
+                starts.add(instr.args[0][1])
+    starts.discard(len(program))
+    return starts
+
+
+class Block:
+    """Basic block starting at index `start`"""
+    def __init__(self, start: int):
+        self.start = start
+        # instructions in order of execution
+        self.instructions = []
+        # index where execution continues if the last instruction doesn't jump
+        self.end = start
+        # number of source instructions, see `Instruction.weight`
+        self.weight = 0
+        # starts of blocks which can be executed next, `CALL` continues after return
+        self.successors = []
+        self.predecessors = []
+        # start of called function if block ends with `CALL`
+        self.call = None
+        # methods of instructions or compiled block (see `jit`), filled in by `Program`
+        self.handlers = ()
+        # number of executions, counted by `Program` until the block is compiled
+        self.count = 0
+
+    def __repr__(self):
+        return "Block={start: " + str(self.start) + ", end: " + str(self.end) + ", successors: " + \
+               str(self.successors) + "}"
+
+
+class ControlFlowGraph:
+    """Basic blocks of program, block is created when it is first needed
+
+    Interpreter creates only blocks which are executed, analysis methods
+    create all of them.
+    """
+    def __init__(self, program: list):
+        self.program = program
+        self.starts = leaders(program)
+        self.sorted_starts = sorted(self.starts)
+        # superinstructions are skipped only in optimized program, otherwise blocks are just slices
+        self.fused = any("+" in instr.opcode for instr in program)
+        # block starting at every index, `None` for other indices and blocks not created yet
+        self.block_at = [None] * len(program)
+        self.predecessors_found = False
+
+    def block(self, start: int) -> Block:
+        """Returns block starting at index `start`, which must be one of `starts`"""
+        block = self.block_at[start]
+        if block is None:
+            block = self.block_at[start] = self.split(start)
+        return block
+
+    def blocks(self) -> list:
+        """Returns all blocks sorted by start, with their predecessors"""
+        blocks = [self.block(start) for start in self.sorted_starts]
+        if not self.predecessors_found:
+            for block in blocks:
+                for successor in block.successors:
+                    self.block_at[successor].predecessors.append(block.start)
+            self.predecessors_found = True
+        return blocks
+
+    def split(self, start: int) -> Block:
+        """Creates block starting at `start`, it ends at branch or before start of another block"""
+        program = self.program
+        block = Block(start)
+        if not self.fused:
+            position = bisect_right(self.sorted_starts, start)
+            block.end = self.sorted_starts[position] if position < len(self.sorted_starts) else len(program)
+            block.instructions = program[start:block.end]
+            block.weight = sum([instr.weight for instr in block.instructions])
+            self.link(block)
+            return block
+
+        starts = self.starts
+        index = start
+        while True:
+            instr = program[index]
+            block.instructions.append(instr)
+            block.weight += instr.weight
+            index += length(instr)
+            if instr.opcode in BRANCHES or index >= len(program) or index in starts:
+                break
+        block.end = index
+        self.link(block)
+        return block
+
+    def link(self, block: Block):
+        """Sets successors of block by its last instruction"""
+        instr = block.instructions[-1]
+        index = block.end
+        opcode = instr.opcode
+        if opcode == "JUMP":
+            successors = [instr.args[0][1]]
+        elif opcode in ("RETURN", "EXIT"):
+            successors = []
+        elif opcode == "CALL":
+            block.call = instr.args[0][1]
+            successors = [index]
+        elif opcode in BRANCHES:
+            successors = [instr.args[0][1], index]
+        else:
+            successors = [index]
+        # end of program is not a block
+        block.successors = [successor for successor in successors if successor < len(self.program)]
+
+    def entries(self) -> list:
+        """Starts of main program and of all functions"""
+        return [0, *self.functions()] if self.program else []
+
+    def reachable(self, entry: int) -> set:
+        """Starts of blocks executed from `entry` until the end or `RETURN`, called functions are not included"""
+        result = set()
+        pending = [entry]
+        while pending:
+            start = pending.pop()
+            if start not in result:
+                result.add(start)
+                pending.extend(self.block(start).successors)
+        return result
+
+    def functions(self) -> dict:
+        """Blocks of functions by start of their entry block, function is target of `CALL`"""
+        targets = sorted({block.call for block in self.blocks() if block.call is not None})
+        return {entry: self.reachable(entry) for entry in targets}
+
+    def back_edges(self, entry: int) -> list:
+        """Edges `(block, header)` to a block on the path from `entry`, found by depth first search"""
+        edges = []
+        visited = {entry}
+        path = {entry}
+        stack = [(entry, iter(self.block(entry).successors))]
+        while stack:
+            start, successors = stack[-1]
+            for successor in successors:
+                if successor in path:
+                    edges.append((start, successor))
+                elif successor not in visited:
+                    visited.add(successor)
+                    path.add(successor)
+                    stack.append((successor, iter(self.block(successor).successors)))
+                    break
+            else:
+                stack.pop()
+                path.discard(start)
+        return edges
+
+    def loops(self) -> dict:
+        """Blocks of loops by start of their header
+
+        Loop consists of its header and blocks from which a back edge to the
+        header can be reached without passing the header.
+        """
+        self.blocks()
+        loops = {}
+        for entry in self.entries():
+            for tail, header in self.back_edges(entry):
+                body = loops.setdefault(header, {header})
+                pending = [tail]
+                while pending:
+                    start = pending.pop()
+                    if start not in body:
+                        body.add(start)
+                        pending.extend(self.block_at[start].predecessors)
+        return loops
@@ -2,11 +2,12 @@ from enum import IntEnum
 import sys
 
 
-def eprint(*args):
-    """Shortcut print function"""
+def eprint(*args, file=None):
+    """Shortcut print function, prints to standard error output unless `file` is given"""
+    file = sys.stderr if file is None else file
     for arg in args:
-        print(arg, file=sys.stderr, end=" ")
-    print("", file=sys.stderr)
+        print(arg, file=file, end=" ")
+    print("", file=file)
 
 
 class Error(IntEnum):
@@ -25,5 +26,73 @@ class Error(IntEnum):
     ERR_INTERNAL = 99
 
     def exit(self):
-        eprint("Error: " + self.name)
-        exit(self)
+        """Ends interpretation by raising exception of this error, see `InterpretError`"""
+        raise error_exceptions[self]()
+
+
+class InterpretError(Exception):
+    """Base of interpretation errors, `error` holds the `Error` code"""
+    error = Error.ERR_INTERNAL
+
+    def __init__(self):
+        super().__init__(self.error.name)
+
+    def exit(self):
+        """Reports error and exits process with its code, used by command line scripts"""
+        eprint("Error: " + self.error.name)
+        exit(self.error)
+
+
+class ArgumentError(InterpretError):
+    error = Error.ERR_ARGS
+
+
+class InputError(InterpretError):
+    error = Error.ERR_INPUT
+
+
+class OutputError(InterpretError):
+    error = Error.ERR_OUTPUT
+
+
+class XmlParseError(InterpretError):
+    error = Error.ERR_XML_PARSE
+
+
+class XmlStructureError(InterpretError):
+    error = Error.ERR_XML_STRUCT
+
+
+class SemanticError(InterpretError):
+    error = Error.ERR_SEMANTIC
+
+
+class OperandTypeError(InterpretError):
+    error = Error.ERR_OP_TYPE
+
+
+class VariableNotFoundError(InterpretError):
+    error = Error.ERR_VAR_NOT_FOUND
+
+
+class FrameNotFoundError(InterpretError):
+    error = Error.ERR_FRAME_NOT_FOUND
+
+
+class MissingValueError(InterpretError):
+    error = Error.ERR_MISSING_VALUE
+
+
+class OperandValueError(InterpretError):
+    error = Error.ERR_OP_VALUE
+
+
+class StringError(InterpretError):
+    error = Error.ERR_STRING
+
+
+class InternalError(InterpretError):
+    error = Error.ERR_INTERNAL
+
+
+error_exceptions = {exception.error: exception for exception in InterpretError.__subclasses__()}
@@ -24,6 +24,21 @@ help_strings = [
     "--input=FILEPATH  - Program input",
     "--source=FILEPATH - Program source file\n",
     "Either --source or --input must be set. Both can be passed at the same time\n",
+    "--buffer=SIZE     - Size of output buffer in bytes, at least 2, default is 65536",
+    "--unbuffered      - Output is written immediately after every WRITE, exclusive with --buffer\n",
+    "--profile=FILE    - Writes execution counts and times of opcodes, instructions and called labels",
+    "                    as JSON to FILE and as a text table to FILE.txt",
+    "--stream          - Source is parsed and checked incrementally, whole XML tree is not kept in memory",
+    "--cache[=DIR]     - Decoded programs are stored in DIR and loaded from it by later runs,",
+    "                    default DIR is $XDG_CACHE_HOME/ipp-interpret",
+    "--no-cache        - Source is always decoded again and nothing is stored, this is the default",
+    "--optimize        - Constant expressions are computed and unreachable code and labels are removed",
+    "                    before run, common instruction sequences are run as single superinstructions",
+    "--no-jit          - Frequently executed blocks are not compiled to Python functions",
+    "--emit-python=FILE - Program is translated to Python module written to FILE instead of running it,",
+    "                    the module is run with the same arguments except --source, --stream and --optimize",
+    "                    by the same version of the interpreter, which stays in its directory",
+    "--aot             - Whole program is translated to Python before run, translation is cached with --cache\n",
     "Return codes:",
     " 0 - Success",
     "10 - Invalid argument or combnination of arguments",
@@ -106,3 +121,18 @@ opcodes = {
     'JUMPIFNEQ': [ArgType.LABEL, ArgType.SYMBOL, ArgType.SYMBOL],
     'JUMPIFEQ':  [ArgType.LABEL, ArgType.SYMBOL, ArgType.SYMBOL]
 }
+
+# superinstructions created by `peephole.optimize`, they can't appear in source
+fused_opcodes = (
+    "PUSHS+PUSHS+OPS+POPS",
+    "PUSHS+PUSHS+OPS",
+    "PUSHS+PUSHS+JUMPIFS",
+    "PUSHS+OPS",
+    "OPS+POPS",
+    "COMPARE+JUMPIF",
+    "DEFVAR+MOVE",
+    "CREATEFRAME+PUSHFRAME",
+)
+
+# opcodes are dispatched by their index in `opcodes`, superinstructions follow them
+opcode_ids = {opcode: index for index, opcode in enumerate((*opcodes, *fused_opcodes))}
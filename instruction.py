@@ -0,0 +1,184 @@
+from var import *
+from helper import opcode_ids
+from parse import check_root, check_instruction
+
+
+class Instruction:
+    """Decoded form of one `<instruction>` element
+
+    `args` holds `(type, value)` pairs, where value of `var` is already split
+    into `(scope, slot)` (see `Code`), constants are shared `Var` instances from constant
+    pool and labels are resolved to index of target instruction
+    """
+    # weights of instructions replaced by superinstruction, see `peephole`
+    part_weights = ()
+
+    def __init__(self, opcode: str, order: int, args: tuple):
+        self.opcode = opcode
+        self.opcode_id = opcode_ids[opcode]
+        self.order = order
+        self.args = args
+        # number of source instructions, more than one for superinstructions
+        self.weight = 1
+
+    def __repr__(self):
+        return "Instruction={opcode: " + self.opcode + ", order: " + str(self.order) + ", args: " + str(self.args) + "}"
+
+
+# local and temporary frames are lists indexed by slot if program
+# doesn't use more names in them, otherwise they are indexed by name
+MAX_FRAME_SLOTS = 256
+
+
+class Code:
+    """Decoded program, names of variables are assigned to frame slots
+
+    Operands of type `var` hold `(scope, slot)`. Slot is index into list for
+    global frame. For local and temporary frames it is index too if
+    `local_slots` is set, otherwise it is name of the variable.
+    """
+    def __init__(self, instructions: list, global_names: list, local_names: list):
+        self.instructions = instructions
+        self.global_names = global_names
+        self.local_names = local_names
+        self.local_slots = len(local_names) <= MAX_FRAME_SLOTS
+        # attributes of root element
+        self.name = None
+        self.description = None
+
+
+def decode_arg(arg_type: str, text, operands: dict, global_slots: dict, local_slots: dict):
+    """Returns decoded operand, equal operands are shared through `operands`
+
+    Constants are looked up by their type and text (constant pool), other
+    operands by themselves, so the pool only keeps what the program uses.
+    """
+    if arg_type == "var":
+        # slots are numbered in order of first use
+        scope, name = text[0:2], text[3:]
+        slots = global_slots if scope == "GF" else local_slots
+        if name not in slots:
+            slots[name] = len(slots)
+        operand = arg_type, (scope, slots[name])
+        return operands.setdefault(operand, operand)
+    elif arg_type == "label":
+        # replaced by index of target, see `link`
+        return arg_type, text
+    elif arg_type == "type":
+        operand = arg_type, text
+        return operands.setdefault(operand, operand)
+    else:
+        # constant pool, same literals share one instance
+        key = (arg_type, text)
+        if key not in operands:
+            operands[key] = arg_type, Var.from_symbol(arg_type, text)
+        return operands[key]
+
+
+def decode_program(program) -> Code:
+    """Checks XML tree and decodes its instructions in one pass, result is sorted by order"""
+    check_root(program)
+    code = decode_instructions(program)
+    code.name = program.get("name")
+    code.description = program.get("description")
+    return code
+
+
+def load_stream(source) -> Code:
+    """Same as `decode_program`, but reads XML from `source` incrementally
+
+    Every instruction element is dropped as soon as it is decoded, so the
+    whole tree is never kept in memory. Unlike parsing the whole tree
+    first, invalid structure may be reported before malformed XML later
+    in the source.
+    """
+    root_attrib = {}
+    code = decode_instructions(stream_elements(source, root_attrib))
+    code.name = root_attrib.get("name")
+    code.description = root_attrib.get("description")
+    return code
+
+
+def stream_elements(source, root_attrib: dict):
+    """Yields children of checked root element, each is cleared after it is processed
+
+    Attributes of root element are copied to `root_attrib`.
+    """
+    import xml.etree.ElementTree as Et
+
+    depth = 0
+    root = None
+    try:
+        for event, element in Et.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    root = element
+                    check_root(root)
+                    root_attrib.update(root.attrib)
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1:
+                yield element
+                element.clear()
+                root.remove(element)
+    except Et.ParseError:
+        Error.ERR_XML_PARSE.exit()
+
+
+def decode_instructions(elements) -> Code:
+    instructions = []
+    orders = set()
+    operands = {}
+    global_slots = {}
+    local_slots = {}
+    for element in elements:
+        opcode, order, args = check_instruction(element, orders)
+        for index, arg in enumerate(args):
+            args[index] = decode_arg(arg[0], arg[1], operands, global_slots, local_slots)
+        instructions.append(Instruction(opcode, order, tuple(args)))
+    instructions.sort(key=lambda instr: instr.order)
+
+    # check duplicate labels
+    labels = {}
+    for index, instr in enumerate(instructions):
+        if instr.opcode == "LABEL":
+            if instr.args[0][1] in labels:
+                Error.ERR_SEMANTIC.exit()
+            labels[instr.args[0][1]] = index
+
+    link(instructions, labels)
+
+    code = Code(instructions, list(global_slots), list(local_slots))
+    if not code.local_slots:
+        use_local_names(code)
+    return code
+
+
+def link(instructions: list, labels: dict):
+    """Replaces label operands of jumps and calls with index of target instruction
+
+    Undefined label is reported before execution, even if the jump is never executed.
+    """
+    for instr in instructions:
+        if opcode_has_target(instr.opcode):
+            (_, label), *rest = instr.args
+            if label not in labels:
+                Error.ERR_SEMANTIC.exit()
+            instr.args = (("label", labels[label]), *rest)
+
+
+def use_local_names(code: Code):
+    """Replaces slots of local and temporary variables with their names, used for frames with too many names"""
+    for instr in code.instructions:
+        args = []
+        for arg_type, value in instr.args:
+            if arg_type == "var" and value[0] != "GF":
+                value = value[0], code.local_names[value[1]]
+            args.append((arg_type, value))
+        instr.args = tuple(args)
+
+
+def opcode_has_target(opcode: str) -> bool:
+    return opcode in ("JUMP", "CALL", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS")
@@ -1,110 +1,60 @@
-import xml.etree.ElementTree as Et
-from copy import copy, deepcopy
+import io
 
 # my imports
 from helper import *
 from error import *
 from var import *
 from parse import *
+from instruction import *
+from reader import InputReader
+from profiler import Profiler
+from cfg import ControlFlowGraph, length
+import jit
+from time import perf_counter
 
 
-class OpType(Enum):
-    ADD = 0,
-    SUB = 1
-    MUL = 2,
-    IDIV = 3,
-    DIV = 4
+class ProgramExit(Exception):
+    """Raised by `EXIT` instruction, `code` is the requested exit code"""
+    def __init__(self, code: int):
+        super().__init__(code)
+        self.code = code
 
 
-class CompOpType(Enum):
-    LESSER = 0,
-    GREATER = 1,
-    EQUAL = 2,
-
-
-class LogicOpType(Enum):
-    AND = 0
-    OR = 1,
+class Frame(dict):
+    """Frame indexed by names of variables, undefined variables are `None` same as in list frames"""
+    def __missing__(self, key):
+        return None
 
 
 class Program:
-    def __init__(self, program, stats: Stats):
-        self.program = sorted(program, key=lambda instr: int(instr.get("order")))
-
-        # check duplicate labels
-        labels = list(map(lambda x: (x[1].find("arg1").text, x[0]), filter(lambda i: i[1].get("opcode") == "LABEL", enumerate(self.program))))
-        self.labels = {}
-        for k, v in labels:
-            if k not in self.labels:
-                self.labels[k] = v
-            else:
-                Error.ERR_SEMANTIC.exit()
-        
-        self.global_frame = {}
+    def __init__(self, code: Code, stats: Stats, unbuffered: bool = False, profiler: Profiler = None,
+                 stdin=None, stdout=None, stderr=None, jit_enabled: bool = True, translated: dict = None):
+        # decoded instructions, see `decode_program`
+        self.code = code
+        self.program = code.instructions
+
+        # variables are stored in slots assigned by `decode_program`, `None` marks undefined variable
+        self.global_frame = [None] * len(code.global_names)
         self.frames = []
         self.temp_frame = None
         self.data_stack = []
         self.call_stack = []
 
-        # monster
-        self.handlers = {
-            "CREATEFRAME": self.create_frame,
-            "PUSHFRAME": self.push_frame,
-            "POPFRAME": self.pop_frame,
-            "DEFVAR": self.defvar,
-            "MOVE": self.move,
-            "WRITE": self.write,
-            "EXIT": self.exit,
-            "PUSHS": self.push,
-            "POPS": self.pop,
-            "TYPE": self.type_op,
-            "JUMP": self.jump,
-            "JUMPIFEQ": lambda: self.jumpif(equal=True),
-            "JUMPIFNEQ": lambda: self.jumpif(equal=False),
-            "ADD": lambda: self.math(op=OpType.ADD),
-            "SUB": lambda: self.math(op=OpType.SUB),
-            "MUL": lambda: self.math(op=OpType.MUL),
-            "DIV": lambda: self.math(op=OpType.DIV),
-            "IDIV": lambda: self.math(op=OpType.IDIV),
-            "READ": self.read,
-            "CALL": self.call,
-            "RETURN": self.return_op,
-            "LT": lambda: self.comp(op=CompOpType.LESSER),
-            "GT": lambda: self.comp(op=CompOpType.GREATER),
-            "EQ": lambda: self.comp(op=CompOpType.EQUAL),
-            "AND": lambda: self.logic(op=LogicOpType.AND),
-            "OR": lambda: self.logic(op=LogicOpType.OR),
-            "NOT": self.not_op,
-            "DPRINT": self.dprint,
-            "BREAK": self.break_op,
-            "LABEL": self.label_op,
-            "INT2CHAR": self.int_to_char,
-            "STRI2INT": self.stri_to_int,
-            "INT2FLOAT": self.int_to_float,
-            "FLOAT2INT": self.float_to_int,
-            "CONCAT": self.concat,
-            "STRLEN": self.strlen,
-            "GETCHAR": self.get_char,
-            "SETCHAR": self.set_char,
-            "CLEARS": self.clears,
-            "ADDS": lambda: self.maths(op=OpType.ADD),
-            "SUBS": lambda: self.maths(op=OpType.SUB),
-            "MULS": lambda: self.maths(op=OpType.MUL),
-            "IDIVS": lambda: self.maths(op=OpType.IDIV),
-            "DIVS": lambda: self.maths(op=OpType.DIV),
-            "LTS": lambda: self.comps(op=CompOpType.LESSER),
-            "GTS": lambda: self.comps(op=CompOpType.GREATER),
-            "EQS": lambda: self.comps(op=CompOpType.EQUAL),
-            "ANDS": lambda: self.logics(op=LogicOpType.AND),
-            "ORS": lambda: self.logics(op=LogicOpType.OR),
-            "NOTS": self.nots_op,
-            "INT2CHARS": self.int_to_chars,
-            "STRI2INTS": self.stri_to_ints,
-            "JUMPIFEQS": lambda: self.jumpifs(equal=True),
-            "JUMPIFNEQS": lambda: self.jumpifs(equal=False),
-        }
-
         self.stats = stats
+        # numbers of defined variables in temporary frame and in local frames, only counted with stats
+        self.temp_vars = 0
+        self.frame_vars = []
+        self.profiler = profiler
+        self.unbuffered = unbuffered
+        # hot blocks are compiled, see `execute_blocks`
+        self.jit_enabled = jit_enabled
+        # functions of blocks by their start if program was translated by `aot`
+        self.translated = translated
+        # streams of interpreted program, standard streams by default
+        self.output = sys.stdout if stdout is None else stdout
+        self.error_output = sys.stderr if stderr is None else stderr
+        # user should see the prompt before input is requested
+        self.input = InputReader(sys.stdin if stdin is None else stdin, output=self.output)
 
         self.ip = 0
     
@@ -114,64 +64,73 @@ class Program:
     def __next__(self):
         if self.ip >= len(self.program):
             raise StopIteration
+        instr = self.program[self.ip]
         if self.stats is not None:
-            self.stats.insts += 1
-            var_count = 0
-            if self.temp_frame is not None:
-                var_count += len(self.temp_frame)
-            var_count += len(self.global_frame)
-            for frame in self.frames:
-                var_count += len(frame)
-            if var_count > self.stats.vars:
-                self.stats.vars = var_count
-        return self.program[self.ip]
+            # superinstruction counts as all instructions it replaced
+            self.stats.insts += instr.weight
+        return instr
 
     def fetch_args(self):
-        instr = self.program[self.ip]
-        args = []
-        for num in range(1, len(instr) + 1):
-            key = "arg" + str(num)
-            arg = instr.find(key)
-            args.append((arg.get("type"), arg.text))
-        return args
+        return self.program[self.ip].args
 
-    @staticmethod
-    def parse_var(var):
-        scope = var[0:2]
-        name = var[3:]
-        return scope, name
+    def new_frame(self):
+        if self.code.local_slots:
+            return [None] * len(self.code.local_names)
+        return Frame()
+
+    def count_var(self, scope: str):
+        """Counts variable defined in frame `scope`, frames are not searched when they are dropped"""
+        if scope == "TF":
+            self.temp_vars += 1
+        elif scope == "LF":
+            self.frame_vars[-1] += 1
+        self.stats.add_var()
 
-    def is_var_defined(self, scope, name) -> bool:
+    def get_frame(self, scope):
         if scope == "GF":
-            return name in self.global_frame
+            return self.global_frame
         elif scope == "LF":
             if len(self.frames) == 0:
                 Error.ERR_FRAME_NOT_FOUND.exit()
-            return name in self.frames[-1]
+            return self.frames[-1]
         else:
             # must be "TF"
             if self.temp_frame is None:
                 Error.ERR_FRAME_NOT_FOUND.exit()
-            return name in self.temp_frame
+            return self.temp_frame
 
     def symbol_to_var(self, symbol_value) -> Var:
-        scope, name = Program.parse_var(symbol_value)
-        if not self.is_var_defined(scope, name):
-            Error.ERR_VAR_NOT_FOUND.exit()
-        
+        scope, slot = symbol_value
+        # inlined `get_frame`, this is the most common operation
         if scope == "GF":
-            return self.global_frame[name]
+            var = self.global_frame[slot]
         elif scope == "LF":
-            return self.frames[-1][name]
+            if len(self.frames) == 0:
+                Error.ERR_FRAME_NOT_FOUND.exit()
+            var = self.frames[-1][slot]
         else:
             # must be "TF"
-            return self.temp_frame[name]
+            if self.temp_frame is None:
+                Error.ERR_FRAME_NOT_FOUND.exit()
+            var = self.temp_frame[slot]
+
+        if var is None:
+            Error.ERR_VAR_NOT_FOUND.exit()
+        return var
+
+    def target_slot(self, symbol_value):
+        """Returns frame and slot of defined variable, so result of instruction can be stored there"""
+        scope, slot = symbol_value
+        frame = self.get_frame(scope)
+        if frame[slot] is None:
+            Error.ERR_VAR_NOT_FOUND.exit()
+        return frame, slot
 
-    def arg_to_var(self, symbol_type: str, symbol_value: str) -> Var:
+    def arg_to_var(self, symbol_type: str, symbol_value) -> Var:
         if symbol_type == "var":
             return self.symbol_to_var(symbol_value)
         else:
-            return Var.from_symbol(symbol_type, symbol_value)
+            return symbol_value
 
     @staticmethod
     def check_def(variable: Var):
@@ -184,7 +143,10 @@ class Program:
         return self.data_stack.pop()
 
     def create_frame(self):
-        self.temp_frame = {}
+        if self.stats is not None:
+            self.stats.drop_vars(self.temp_vars)
+            self.temp_vars = 0
+        self.temp_frame = self.new_frame()
         self.ip += 1
 
     def push_frame(self):
@@ -192,40 +154,43 @@ class Program:
             Error.ERR_FRAME_NOT_FOUND.exit()
         self.frames.append(self.temp_frame)
         self.temp_frame = None
+        if self.stats is not None:
+            self.frame_vars.append(self.temp_vars)
+            self.temp_vars = 0
         self.ip += 1
 
     def pop_frame(self):
         if len(self.frames) > 0:
+            if self.stats is not None:
+                self.stats.drop_vars(self.temp_vars)
+                self.temp_vars = self.frame_vars.pop()
             self.temp_frame = self.frames.pop()
         else:
             Error.ERR_FRAME_NOT_FOUND.exit()
         self.ip += 1
 
     def defvar(self):
-        _, name = self.fetch_args()[0]
-        scope, name = Program.parse_var(name)
-        
+        _, (scope, slot) = self.fetch_args()[0]
+        frame = self.get_frame(scope)
+
         # check redefinition
-        if self.is_var_defined(scope, name):
+        if frame[slot] is not None:
             Error.ERR_SEMANTIC.exit()
-        
-        if scope == "GF":
-            self.global_frame[name] = Var(VarType.UNDEF, None)
-        elif scope == "LF":
-            self.frames[-1][name] = Var(VarType.UNDEF, None)
-        else:
-            # must be "TF"
-            self.temp_frame[name] = Var(VarType.UNDEF, None)
+
+        frame[slot] = Var.UNDEF
+        if self.stats is not None:
+            self.count_var(scope)
         self.ip += 1
 
     def move(self):
         (_, target), (source_type, source_value) = self.fetch_args()
-        target_var = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         source_var = self.arg_to_var(source_type, source_value)
         Program.check_def(source_var)
+        if source_var.__class__ is StrVar:
+            source_var.shared = True
 
-        target_var.value = copy(source_var.value)
-        target_var.var_type = copy(source_var.var_type)
+        frame[slot] = source_var
         self.ip += 1
 
     def write(self):
@@ -247,14 +212,16 @@ class Program:
         else:
             # must be `VarType.UNDEF`
             Error.ERR_MISSING_VALUE.exit()
-        print(val_to_write, end="", flush=True)
+        self.output.write(val_to_write)
+        if self.unbuffered:
+            self.output.flush()
         self.ip += 1
 
     def exit(self):
         symb_type, symb_value = self.fetch_args()[0]
 
         if symb_type == "int":
-            val = int(symb_value)
+            val = symb_value.value
         elif symb_type == "var":
             var = self.symbol_to_var(symb_value)
             Program.check_def(var)
@@ -269,23 +236,25 @@ class Program:
         if val > 49 or val < 0:
             Error.ERR_OP_VALUE.exit()
         self.print_stats()
-        exit(val)
+        self.print_profile()
+        self.output.flush()
+        raise ProgramExit(val)
 
     def push(self):
         source_type, source_value = self.fetch_args()[0]
         var = self.arg_to_var(source_type, source_value)
         Program.check_def(var)
-        self.data_stack.append(deepcopy(var))
+        if var.__class__ is StrVar:
+            var.shared = True
+        self.data_stack.append(var)
         self.ip += 1
 
     def pop(self):
         if len(self.data_stack) == 0:
             Error.ERR_MISSING_VALUE.exit()
         _, dst = self.fetch_args()[0]
-        var = self.symbol_to_var(dst)
-        pop = self.data_stack.pop()
-        var.var_type = pop.var_type
-        var.value = pop.value
+        frame, slot = self.target_slot(dst)
+        frame[slot] = self.data_stack.pop()
         self.ip += 1
 
     def clears(self):
@@ -294,129 +263,181 @@ class Program:
 
     def type_op(self):
         (_, dest_loc), (src_type, src_val) = self.fetch_args()
-        dest_var = self.symbol_to_var(dest_loc)
+        frame, slot = self.target_slot(dest_loc)
 
         if src_type == "var":
             src_var = self.symbol_to_var(src_val)
             if src_var.var_type == VarType.STRING:
-                dest_var.value = "string"
+                type_name = "string"
             elif src_var.var_type == VarType.UNDEF:
-                dest_var.value = ""
+                type_name = ""
             elif src_var.var_type == VarType.NIL:
-                dest_var.value = "nil"
+                type_name = "nil"
             elif src_var.var_type == VarType.INT:
-                dest_var.value = "int"
+                type_name = "int"
             elif src_var.var_type == VarType.BOOL:
-                dest_var.value = "bool"
+                type_name = "bool"
             elif src_var.var_type == VarType.FLOAT:
-                dest_var.value = "float"
+                type_name = "float"
             else:
-                Error.ERR_XML_STRUCT.exit()   
+                Error.ERR_XML_STRUCT.exit()
+                # added so pycharm wont show warning
+                return
         else:
-            dest_var.value = src_type
-        dest_var.var_type = VarType.STRING
+            type_name = src_type
+        frame[slot] = Var(VarType.STRING, type_name)
         self.ip += 1
 
     def jump(self):
-        _, label = self.fetch_args()[0]
-        if label not in self.labels:
-            Error.ERR_SEMANTIC.exit()
-        self.ip = self.labels[label]
+        _, target = self.fetch_args()[0]
+        self.ip = target
 
-    def jumpif(self, *, equal: bool):
-        (_, label), (type_1, value_1), (type_2, value_2) = self.fetch_args()
+    def jumpifeq(self):
+        target, var_1, var_2 = self._jumpif_operands()
+        self._branch(target, Program._equal(var_1, var_2))
 
-        var_1 = self.arg_to_var(type_1, value_1)
-        var_2 = self.arg_to_var(type_2, value_2)
+    def jumpifneq(self):
+        target, var_1, var_2 = self._jumpif_operands()
+        self._branch(target, not Program._equal(var_1, var_2))
 
-        self._jumpif_op(var_1, var_2, label, equal)
+    def jumpifeqs(self):
+        target, var_1, var_2 = self._jumpifs_operands()
+        self._branch(target, Program._equal(var_1, var_2))
 
-    def jumpifs(self, *, equal: bool):
-        _, label = self.fetch_args()[0]
+    def jumpifneqs(self):
+        target, var_1, var_2 = self._jumpifs_operands()
+        self._branch(target, not Program._equal(var_1, var_2))
 
+    def _jumpif_operands(self):
+        (_, target), (type_1, value_1), (type_2, value_2) = self.fetch_args()
+        var_1 = self.arg_to_var(type_1, value_1)
+        var_2 = self.arg_to_var(type_2, value_2)
+        return target, var_1, var_2
+
+    def _jumpifs_operands(self):
+        _, target = self.fetch_args()[0]
         var_2 = self.stack_pop()
         var_1 = self.stack_pop()
+        return target, var_1, var_2
 
-        self._jumpif_op(var_1, var_2, label, equal)
-
-    def _jumpif_op(self, var_1: Var, var_2: Var, label: str, equal: bool):
-        if label not in self.labels:
-            Error.ERR_SEMANTIC.exit()
+    def _branch(self, target: int, condition: bool):
+        if condition:
+            self.ip = target
+        else:
+            self.ip += 1
 
+    @staticmethod
+    def _equal(var_1: Var, var_2: Var) -> bool:
         Program.check_def(var_1)
         Program.check_def(var_2)
 
+        # `nil` can be compared with anything
         if var_1.var_type != var_2.var_type and var_1.var_type != VarType.NIL and var_2.var_type != VarType.NIL:
             Error.ERR_OP_TYPE.exit()
-        elif (var_1.value == var_2.value) ^ (not equal):
-            self.ip = self.labels[label]
-        else:
-            self.ip += 1
+        return var_1.value == var_2.value
 
-    def math(self, *, op: OpType):
+    def _binary_op(self, op):
+        """Runs `op` on operands of three address instruction and stores its result"""
         (_, target), (type_1, value_1), (type_2, value_2) = self.fetch_args()
-        target = self.symbol_to_var(target)
-
+        frame, slot = self.target_slot(target)
         var_1 = self.arg_to_var(type_1, value_1)
         var_2 = self.arg_to_var(type_2, value_2)
-
-        Program._math_op(var_1, var_2, target, op)
-
+        frame[slot] = op(var_1, var_2)
         self.ip += 1
 
-    def maths(self, *, op: OpType):
-        target = Var(VarType.UNDEF, None)
-
+    def _stack_op(self, op):
+        """Runs `op` on two values from top of stack and pushes its result"""
         var_2 = self.stack_pop()
         var_1 = self.stack_pop()
 
-        Program._math_op(var_1, var_2, target, op)
-        self.data_stack.append(target)
+        self.data_stack.append(op(var_1, var_2))
         self.ip += 1
 
+    def add(self):
+        self._binary_op(Program._add_op)
+
+    def sub(self):
+        self._binary_op(Program._sub_op)
+
+    def mul(self):
+        self._binary_op(Program._mul_op)
+
+    def div(self):
+        self._binary_op(Program._div_op)
+
+    def idiv(self):
+        self._binary_op(Program._idiv_op)
+
+    def adds(self):
+        self._stack_op(Program._add_op)
+
+    def subs(self):
+        self._stack_op(Program._sub_op)
+
+    def muls(self):
+        self._stack_op(Program._mul_op)
+
+    def divs(self):
+        self._stack_op(Program._div_op)
+
+    def idivs(self):
+        self._stack_op(Program._idiv_op)
+
     @staticmethod
-    def _math_op(var_1: Var, var_2: Var, target: Var, op: OpType):
+    def _check_numbers(var_1: Var, var_2: Var):
         Program.check_def(var_1)
         Program.check_def(var_2)
 
         if var_1.var_type != var_2.var_type or (var_1.var_type != VarType.INT and var_1.var_type != VarType.FLOAT):
             Error.ERR_OP_TYPE.exit()
 
-        if op == OpType.ADD:
-            target.value = var_1.value + var_2.value
-        elif op == OpType.SUB:
-            target.value = var_1.value - var_2.value
-        elif op == OpType.MUL:
-            target.value = var_1.value * var_2.value
-        elif op == OpType.DIV:
-            if var_1.var_type != VarType.FLOAT or var_2.var_type != VarType.FLOAT:
-                Error.ERR_OP_TYPE.exit()
-            if var_2.value == 0.0:
-                Error.ERR_OP_VALUE.exit()
-            target.value = var_1.value / var_2.value
-        else:
-            # must be `IDIV`
-            if var_1.var_type != VarType.INT or var_2.var_type != VarType.INT:
-                Error.ERR_OP_TYPE.exit()
-            if var_2.value == 0:
-                Error.ERR_OP_VALUE.exit()
-            target.value = var_1.value // var_2.value
-        target.var_type = var_1.var_type
-        return target
+    @staticmethod
+    def _add_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_numbers(var_1, var_2)
+        if var_1.var_type == VarType.INT:
+            return Var.of_int(var_1.value + var_2.value)
+        return Var(VarType.FLOAT, var_1.value + var_2.value)
+
+    @staticmethod
+    def _sub_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_numbers(var_1, var_2)
+        if var_1.var_type == VarType.INT:
+            return Var.of_int(var_1.value - var_2.value)
+        return Var(VarType.FLOAT, var_1.value - var_2.value)
+
+    @staticmethod
+    def _mul_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_numbers(var_1, var_2)
+        if var_1.var_type == VarType.INT:
+            return Var.of_int(var_1.value * var_2.value)
+        return Var(VarType.FLOAT, var_1.value * var_2.value)
+
+    @staticmethod
+    def _div_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_numbers(var_1, var_2)
+        if var_1.var_type != VarType.FLOAT:
+            Error.ERR_OP_TYPE.exit()
+        if var_2.value == 0.0:
+            Error.ERR_OP_VALUE.exit()
+        return Var(VarType.FLOAT, var_1.value / var_2.value)
+
+    @staticmethod
+    def _idiv_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_numbers(var_1, var_2)
+        if var_1.var_type != VarType.INT:
+            Error.ERR_OP_TYPE.exit()
+        if var_2.value == 0:
+            Error.ERR_OP_VALUE.exit()
+        return Var.of_int(var_1.value // var_2.value)
 
     def read(self):
         (_, target), (_, src_type) = self.fetch_args()
-        var = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         error = False
-        try:
-            i = input()
-        except EOFError:
-            error = True
-            i = None
+        i = self.input.readline()
 
         if i is None:
-            var.var_type = VarType.NIL
-            var.value = None
+            frame[slot] = Var.NIL
             self.ip += 1
             return
 
@@ -437,121 +458,108 @@ class Program:
             except ValueError:
                 error = True
                 i = None
-        var.value = i
         if error:
-            var.var_type = VarType.NIL
+            frame[slot] = Var.NIL
         else:
-            var.var_type = VarType.from_str(src_type)
+            frame[slot] = Var(VarType.from_str(src_type), i)
         self.ip += 1
 
     def call(self):
-        _, label = self.fetch_args()[0]
-        if label not in self.labels:
-            Error.ERR_SEMANTIC.exit()
+        _, target = self.fetch_args()[0]
         self.call_stack.append(self.ip + 1)
-        self.ip = self.labels[label]
+        self.ip = target
 
     def return_op(self):
         if len(self.call_stack) == 0:
             Error.ERR_MISSING_VALUE.exit()
         self.ip = self.call_stack.pop()
 
-    def comp(self, *, op: CompOpType):
-        (_, target), (type_1, value_1), (type_2, value_2) = self.fetch_args()
-        target = self.symbol_to_var(target)
-        var_1 = self.arg_to_var(type_1, value_1)
-        var_2 = self.arg_to_var(type_2, value_2)
+    def lt(self):
+        self._binary_op(Program._lt_op)
 
-        Program._comp_op(var_1, var_2, target, op)
+    def gt(self):
+        self._binary_op(Program._gt_op)
 
-        self.ip += 1
+    def eq(self):
+        self._binary_op(Program._eq_op)
 
-    def comps(self, *, op: CompOpType):
-        target = Var(VarType.UNDEF, None)
+    def lts(self):
+        self._stack_op(Program._lt_op)
 
-        var_2 = self.stack_pop()
-        var_1 = self.stack_pop()
-
-        Program._comp_op(var_1, var_2, target, op)
+    def gts(self):
+        self._stack_op(Program._gt_op)
 
-        self.data_stack.append(target)
-        self.ip += 1
+    def eqs(self):
+        self._stack_op(Program._eq_op)
 
     @staticmethod
-    def _comp_op(var_1: Var, var_2: Var, target: Var, op: CompOpType):
+    def _check_ordered(var_1: Var, var_2: Var):
         Program.check_def(var_1)
         Program.check_def(var_2)
 
-        if (var_1.var_type == VarType.NIL or var_2.var_type == VarType.NIL) and op != CompOpType.EQUAL:
+        # `nil` can only be checked for equality
+        if var_1.var_type != var_2.var_type or var_1.var_type == VarType.NIL:
             Error.ERR_OP_TYPE.exit()
 
-        target.var_type = VarType.BOOL
-        if var_1.var_type == var_2.var_type and var_1 != VarType.NIL:
-            if op == CompOpType.LESSER:
-                target.value = var_1.value < var_2.value
-            elif op == CompOpType.GREATER:
-                target.value = var_1.value > var_2.value
-            else:
-                # must be `EQUAL`
-                target.value = var_1.value == var_2.value
-        elif (var_1.var_type == VarType.NIL or var_2.var_type == VarType.NIL) and op == CompOpType.EQUAL:
-            target.value = False
-        else:
-            Error.ERR_OP_TYPE.exit()
+    @staticmethod
+    def _lt_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_ordered(var_1, var_2)
+        return Var.of_bool(var_1.value < var_2.value)
 
-    def logic(self, *, op: LogicOpType):
-        (_, target), (type_1, value_1), (type_2, value_2) = self.fetch_args()
-        target = self.symbol_to_var(target)
-        var_1 = self.arg_to_var(type_1, value_1)
-        var_2 = self.arg_to_var(type_2, value_2)
+    @staticmethod
+    def _gt_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_ordered(var_1, var_2)
+        return Var.of_bool(var_1.value > var_2.value)
 
-        Program._logic_op(var_1, var_2, target, op)
+    @staticmethod
+    def _eq_op(var_1: Var, var_2: Var) -> Var:
+        return Var.of_bool(Program._equal(var_1, var_2))
 
-        self.ip += 1
+    def and_op(self):
+        self._binary_op(Program._and_op)
 
-    def logics(self, *, op: LogicOpType):
-        target = Var(VarType.UNDEF, None)
-        var_2 = self.stack_pop()
-        var_1 = self.stack_pop()
+    def or_op(self):
+        self._binary_op(Program._or_op)
 
-        Program._logic_op(var_1, var_2, target, op)
+    def ands(self):
+        self._stack_op(Program._and_op)
 
-        self.data_stack.append(target)
-        self.ip += 1
+    def ors(self):
+        self._stack_op(Program._or_op)
 
     @staticmethod
-    def _logic_op(var_1: Var, var_2: Var, target: Var, op: LogicOpType):
+    def _check_bools(var_1: Var, var_2: Var):
         Program.check_def(var_1)
         Program.check_def(var_2)
 
-        if var_1.var_type == var_2.var_type and var_1.var_type == VarType.BOOL:
-            target.var_type = VarType.BOOL
-            if op == LogicOpType.AND:
-                target.value = var_1.value and var_2.value
-            else:
-                # must be `OR`
-                target.value = var_1.value or var_2.value
-        else:
+        if var_1.var_type != VarType.BOOL or var_2.var_type != VarType.BOOL:
             Error.ERR_OP_TYPE.exit()
 
+    @staticmethod
+    def _and_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_bools(var_1, var_2)
+        return Var.of_bool(var_1.value and var_2.value)
+
+    @staticmethod
+    def _or_op(var_1: Var, var_2: Var) -> Var:
+        Program._check_bools(var_1, var_2)
+        return Var.of_bool(var_1.value or var_2.value)
+
     def not_op(self):
         (_, target), (type_1, value_1) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         var = self.arg_to_var(type_1, value_1)
         Program.check_def(var)
         if var.var_type == VarType.BOOL:
-            target.var_type = VarType.BOOL
-            target.value = not var.value
+            frame[slot] = Var.of_bool(not var.value)
         else:
             Error.ERR_OP_TYPE.exit()
         self.ip += 1
 
     def nots_op(self):
-        target = self.stack_pop()
-        if target.var_type == VarType.BOOL:
-            target.var_type = VarType.BOOL
-            target.value = not target.value
-            self.data_stack.append(target)
+        var = self.stack_pop()
+        if var.var_type == VarType.BOOL:
+            self.data_stack.append(Var.of_bool(not var.value))
         else:
             Error.ERR_OP_TYPE.exit()
         self.ip += 1
@@ -559,15 +567,27 @@ class Program:
     def dprint(self):
         type_1, value_1 = self.fetch_args()[0]
         var = self.arg_to_var(type_1, value_1)
-        eprint(var)
+        # debug output must not get ahead of buffered program output
+        self.output.flush()
+        eprint(var, file=self.error_output)
         self.ip += 1
 
+    @staticmethod
+    def frame_to_dict(frame, names: list) -> dict:
+        if isinstance(frame, list):
+            return {names[slot]: var for slot, var in enumerate(frame) if var is not None}
+        return dict(frame)
+
     def break_op(self):
-        eprint("frames: " + str(self.frames))
-        eprint("temp_frame: " + str(self.temp_frame))
-        eprint("global: " + str(self.global_frame))
-        eprint("stack: " + str(self.data_stack))
-        eprint("")
+        local_names = self.code.local_names
+        temp_frame = None if self.temp_frame is None else Program.frame_to_dict(self.temp_frame, local_names)
+        file = self.error_output
+        self.output.flush()
+        eprint("frames: " + str([Program.frame_to_dict(frame, local_names) for frame in self.frames]), file=file)
+        eprint("temp_frame: " + str(temp_frame), file=file)
+        eprint("global: " + str(Program.frame_to_dict(self.global_frame, self.code.global_names)), file=file)
+        eprint("stack: " + str(self.data_stack), file=file)
+        eprint("", file=file)
         self.ip += 1
 
     def label_op(self):
@@ -575,59 +595,53 @@ class Program:
 
     def int_to_char(self):
         (_, target), (src_type, src_value) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         src = self.arg_to_var(src_type, src_value)
 
-        Program._int_to_char_op(src, target)
+        frame[slot] = Program._int_to_char_op(src)
 
         self.ip += 1
 
     def int_to_chars(self):
         src = self.stack_pop()
 
-        Program._int_to_char_op(src, src)
-
-        self.data_stack.append(src)
+        self.data_stack.append(Program._int_to_char_op(src))
         self.ip += 1
 
     @staticmethod
-    def _int_to_char_op(src: Var, target: Var):
+    def _int_to_char_op(src: Var) -> Var:
         Program.check_def(src)
         if src.var_type != VarType.INT:
             Error.ERR_OP_TYPE.exit()
 
         try:
             char = chr(src.value)
-        except ValueError:
+        except (ValueError, OverflowError):
             Error.ERR_STRING.exit()
             # added so pycharm wont show warning
             return
 
-        target.value = char
-        target.var_type = VarType.STRING
+        return Var(VarType.STRING, char)
 
     def stri_to_int(self):
         (_, target), (src_type, src_value), (index_type, index_value) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         src = self.arg_to_var(src_type, src_value)
         index = self.arg_to_var(index_type, index_value)
 
-        Program._stri_to_int_op(target, src, index)
+        frame[slot] = Program._stri_to_int_op(src, index)
 
         self.ip += 1
 
     def stri_to_ints(self):
-        target = Var(VarType.UNDEF, None)
         index = self.stack_pop()
         src = self.stack_pop()
 
-        Program._stri_to_int_op(target, src, index)
-
-        self.data_stack.append(target)
+        self.data_stack.append(Program._stri_to_int_op(src, index))
         self.ip += 1
 
     @staticmethod
-    def _stri_to_int_op(target: Var, src: Var, index: Var):
+    def _stri_to_int_op(src: Var, index: Var) -> Var:
         Program.check_def(src)
         Program.check_def(index)
         if src.var_type != VarType.STRING or index.var_type != VarType.INT:
@@ -637,18 +651,17 @@ class Program:
         if index.value < 0:
             Error.ERR_STRING.exit()
         try:
-            char = ord(src.value[index.value])
+            char = ord(src.sequence()[index.value])
         except IndexError:
             Error.ERR_STRING.exit()
             # added so pycharm wont show warning
             return
 
-        target.value = char
-        target.var_type = VarType.INT
+        return Var.of_int(char)
 
     def concat(self):
         (_, target), (type_1, value_1), (type_2, value_2) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         var_1 = self.arg_to_var(type_1, value_1)
         var_2 = self.arg_to_var(type_2, value_2)
 
@@ -658,31 +671,30 @@ class Program:
         if var_1.var_type != VarType.STRING or var_2.var_type != VarType.STRING:
             Error.ERR_OP_TYPE.exit()
 
-        # check empty string, because None + str is a bad idea
-        if var_1.value is None:
-            var_1.value = ""
-        if var_2.value is None:
-            var_2.value = ""
-        
-        target.value = var_1.value + var_2.value
-        target.var_type = VarType.STRING
+        if frame[slot] is var_1:
+            # appending to the same variable, string is built in place
+            if var_1.__class__ is not StrVar or var_1.shared:
+                var_1 = StrVar(list(var_1.sequence()))
+                frame[slot] = var_1
+            var_1.append(var_2.sequence())
+        else:
+            frame[slot] = Var(VarType.STRING, var_1.value + var_2.value)
         self.ip += 1
 
     def strlen(self):
         (_, target), (type_1, value_1) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         var_1 = self.arg_to_var(type_1, value_1)
         Program.check_def(var_1)
         if var_1.var_type != VarType.STRING:
             Error.ERR_OP_TYPE.exit()
-        
-        target.value = len(var_1.value)
-        target.var_type = VarType.INT
+
+        frame[slot] = Var.of_int(len(var_1.sequence()))
         self.ip += 1
 
     def get_char(self):
         (_, target), (src_type, src_value), (index_type, index_value) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         src = self.arg_to_var(src_type, src_value)
         index = self.arg_to_var(index_type, index_value)
 
@@ -696,19 +708,19 @@ class Program:
         if index.value < 0:
             Error.ERR_STRING.exit()
         try:
-            char = src.value[index.value]
+            char = src.sequence()[index.value]
         except IndexError:
             Error.ERR_STRING.exit()
             # added so pycharm wont show warning
             return
-        
-        target.value = char
-        target.var_type = VarType.STRING
+
+        frame[slot] = Var(VarType.STRING, char)
         self.ip += 1
 
     def set_char(self):
         (_, target), (index_type, index_value), (src_type, src_value) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
+        target = frame[slot]
         index = self.arg_to_var(index_type, index_value)
         src = self.arg_to_var(src_type, src_value)
 
@@ -723,17 +735,24 @@ class Program:
         if index.value < 0:
             Error.ERR_STRING.exit()
         try:
-            slist = list(target.value)
-            slist[index.value] = list(src.value)[0]
-            target.value = ''.join(slist)
+            char = src.sequence()[0]
+            if index.value >= len(target.sequence()):
+                raise IndexError
         except IndexError:
             Error.ERR_STRING.exit()
-        
+            # added so pycharm wont show warning
+            return
+
+        # string shared with other variable or constant is copied first
+        if target.__class__ is not StrVar or target.shared:
+            target = StrVar(list(target.sequence()))
+            frame[slot] = target
+        target.set_char(index.value, char)
         self.ip += 1
 
     def int_to_float(self):
         (_, target), (src_type, src_value) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         src = self.arg_to_var(src_type, src_value)
 
         Program.check_def(src)
@@ -743,18 +762,17 @@ class Program:
 
         try:
             fl = float(src.value)
-        except ValueError:
+        except (ValueError, OverflowError):
             Error.ERR_STRING.exit()
             # added so pycharm wont show warning
             return
 
-        target.value = fl
-        target.var_type = VarType.FLOAT
+        frame[slot] = Var(VarType.FLOAT, fl)
         self.ip += 1
 
     def float_to_int(self):
         (_, target), (src_type, src_value) = self.fetch_args()
-        target = self.symbol_to_var(target)
+        frame, slot = self.target_slot(target)
         src = self.arg_to_var(src_type, src_value)
 
         Program.check_def(src)
@@ -764,58 +782,538 @@ class Program:
 
         try:
             i = int(src.value)
-        except ValueError:
+        except (ValueError, OverflowError):
             Error.ERR_STRING.exit()
             # added so pycharm wont show warning
             return
 
-        target.value = i
-        target.var_type = VarType.INT
+        frame[slot] = Var.of_int(i)
         self.ip += 1
 
+    # superinstructions created by `peephole.optimize`, operands are checked in the same order as
+    # by the original instructions, values are not marked as shared because they never get on the stack,
+    # `ip` moves to every following instruction of the sequence before it runs, see `not_executed`
+
+    def push_push_op_pop(self):
+        """PUSHS a; PUSHS b; ADDS; POPS x"""
+        (_, operation), (type_1, value_1), (type_2, value_2), (_, target) = self.fetch_args()
+        var_1 = self.arg_to_var(type_1, value_1)
+        Program.check_def(var_1)
+        self.ip += 1
+        var_2 = self.arg_to_var(type_2, value_2)
+        Program.check_def(var_2)
+        self.ip += 1
+        result = stack_operations[operation](var_1, var_2)
+        self.ip += 1
+        frame, slot = self.target_slot(target)
+        frame[slot] = result
+        self.ip += 1
+
+    def push_push_op(self):
+        """PUSHS a; PUSHS b; ADDS"""
+        (_, operation), (type_1, value_1), (type_2, value_2) = self.fetch_args()
+        var_1 = self.arg_to_var(type_1, value_1)
+        Program.check_def(var_1)
+        self.ip += 1
+        var_2 = self.arg_to_var(type_2, value_2)
+        Program.check_def(var_2)
+        self.ip += 1
+        self.data_stack.append(stack_operations[operation](var_1, var_2))
+        self.ip += 1
+
+    def push_push_jumpifs(self):
+        """PUSHS a; PUSHS b; JUMPIFEQS L (or JUMPIFNEQS)"""
+        (_, target), (type_1, value_1), (type_2, value_2), (_, expected) = self.fetch_args()
+        var_1 = self.arg_to_var(type_1, value_1)
+        Program.check_def(var_1)
+        self.ip += 1
+        var_2 = self.arg_to_var(type_2, value_2)
+        Program.check_def(var_2)
+        self.ip += 1
+        if Program._equal(var_1, var_2) == expected:
+            self.ip = target
+        else:
+            self.ip += 1
+
+    def push_op(self):
+        """PUSHS b; ADDS"""
+        (_, operation), (type_2, value_2) = self.fetch_args()
+        var_2 = self.arg_to_var(type_2, value_2)
+        Program.check_def(var_2)
+        self.ip += 1
+        var_1 = self.stack_pop()
+        self.data_stack.append(stack_operations[operation](var_1, var_2))
+        self.ip += 1
+
+    def op_pop(self):
+        """ADDS; POPS x"""
+        (_, operation), (_, target) = self.fetch_args()
+        var_2 = self.stack_pop()
+        var_1 = self.stack_pop()
+        result = stack_operations[operation](var_1, var_2)
+        self.ip += 1
+        frame, slot = self.target_slot(target)
+        frame[slot] = result
+        self.ip += 1
+
+    def compare_jumpif(self):
+        """LT t a b; JUMPIFEQ L t bool@true, jumps if result is `expected`"""
+        (_, target), (_, dest), (type_1, value_1), (type_2, value_2), (_, operation), (_, expected) = self.fetch_args()
+        frame, slot = self.target_slot(dest)
+        var_1 = self.arg_to_var(type_1, value_1)
+        var_2 = self.arg_to_var(type_2, value_2)
+        result = comparisons[operation](var_1, var_2)
+        frame[slot] = result
+        if result.value == expected:
+            self.ip = target
+        else:
+            self.ip += 2
+
+    def defvar_move(self):
+        """DEFVAR x; MOVE x s"""
+        (_, (scope, slot)), (source_type, source_value) = self.fetch_args()
+        frame = self.get_frame(scope)
+        if frame[slot] is not None:
+            Error.ERR_SEMANTIC.exit()
+        # defined before source is read, `MOVE x x` fails the same way
+        frame[slot] = Var.UNDEF
+        if self.stats is not None:
+            self.count_var(scope)
+        self.ip += 1
+
+        source_var = self.arg_to_var(source_type, source_value)
+        Program.check_def(source_var)
+        if source_var.__class__ is StrVar:
+            source_var.shared = True
+        frame[slot] = source_var
+        self.ip += 1
+
+    def create_push_frame(self):
+        """CREATEFRAME; PUSHFRAME"""
+        if self.stats is not None:
+            self.stats.drop_vars(self.temp_vars)
+            self.temp_vars = 0
+            self.frame_vars.append(0)
+        self.frames.append(self.new_frame())
+        self.temp_frame = None
+        self.ip += 2
+
+    def evaluate(self, instr: Instruction):
+        """Runs instruction with constant operands on this empty program, used by `simplify`
+
+        Result is stored to the first global variable. Returns the result, for
+        conditional jump whether it is taken. Returns `None` if the instruction
+        fails, so it is left to fail at runtime.
+        """
+        target, *operands = instr.args
+        jump = instr.opcode in ("JUMPIFEQ", "JUMPIFNEQ")
+        # jump target is not a valid index, so taken jump is recognized by it
+        target = ("label", -1) if jump else ("var", ("GF", 0))
+        self.program = [Instruction(instr.opcode, instr.order, (target, *operands))]
+        self.ip = 0
+        self.global_frame[0] = Var.UNDEF
+        try:
+            dispatch_table[self.program[0].opcode_id](self)
+        except InterpretError:
+            # error must happen at runtime with the same code
+            return None
+        return self.ip == -1 if jump else self.global_frame[0]
+
     def print_stats(self):
         if self.stats is not None:
+            # stats are only collected if there is no path
+            if self.stats.path is not None:
+                try:
+                    file = open(self.stats.path, 'w')
+                except OSError:
+                    Error.ERR_OUTPUT.exit()
+                    # added so pycharm wont show warning
+                    return
+
+                for stat in self.stats.opts:
+                    if stat == Stat.VARS:
+                        count = self.stats.vars
+                    else:
+                        # must be `Stat.INSTS`
+                        count = self.stats.insts
+                    file.write(str(count) + '\n')
+                # debug output of the original interpreter, it must not get into output of program
+                eprint(self.stats, file=self.error_output)
+
+    def print_profile(self):
+        if self.profiler is not None:
             try:
-                file = open(self.stats.path, 'w')
+                self.profiler.write()
             except OSError:
                 Error.ERR_OUTPUT.exit()
-                # added so pycharm wont show warning
-                return
-
-            for stat in self.stats.opts:
-                if stat == Stat.VARS:
-                    count = self.stats.vars
-                else:
-                    # must be `Stat.INSTS`
-                    count = self.stats.insts
-                file.write(str(count) + '\n')
-            print(self.stats)
 
     def execute(self):
-        for instr in self:
-            # opcode dict has uppercase keys
-            opcode = instr.get("opcode").upper()
-            if opcode not in self.handlers:
-                Error.ERR_SEMANTIC.exit()
+        try:
+            if self.profiler is not None:
+                self.execute_profiled()
             else:
-                self.handlers[opcode]()
+                self.execute_blocks()
+        except InterpretError:
+            # counts of failed program are written as well, but its error is the one reported
+            try:
+                self.print_stats()
+            except InterpretError:
+                pass
+            raise
         self.print_stats()
+        self.print_profile()
+        self.output.flush()
+
+    def execute_blocks(self):
+        """Runs whole basic blocks (see `cfg`), `ip` is checked and instructions counted once per block
+
+        Block is created when it is entered for the second time, the first
+        time it runs instruction by instruction, so code which runs once
+        doesn't pay for it. Block executed `jit.THRESHOLD` times is compiled
+        to Python function. Blocks of translated program are run by their
+        functions from the start.
+        """
+        program = self.program
+        graph = ControlFlowGraph(program)
+        blocks = graph.block_at
+        starts = graph.starts
+        entered = set()
+        translated = self.translated
+        # count of block never reaches 0, so nothing is compiled without jit
+        threshold = jit.THRESHOLD if self.jit_enabled and translated is None else 0
+        stats = self.stats
+        end = len(program)
+        while self.ip < end:
+            block = blocks[self.ip]
+            if block is None:
+                if translated is None and self.ip not in entered:
+                    entered.add(self.ip)
+                    try:
+                        while True:
+                            instr = program[self.ip]
+                            if stats is not None:
+                                stats.insts += instr.weight
+                            dispatch_table[instr.opcode_id](self)
+                            if self.ip >= end or self.ip in starts:
+                                break
+                    except InterpretError:
+                        if stats is not None:
+                            stats.insts -= self.not_executed([instr], self.start_of(instr))
+                        raise
+                    continue
+                block = graph.block(self.ip)
+                if translated is not None:
+                    block.handlers = (translated[self.ip],)
+                else:
+                    block.handlers = tuple([dispatch_table[instr.opcode_id] for instr in block.instructions])
 
+            block.count += 1
+            if block.count == threshold:
+                block.handlers = (jit.compile_block(block, dispatch_table, stats),)
+
+            if stats is not None:
+                # counted before running, `EXIT` does not return
+                stats.insts += block.weight
+            try:
+                for handler in block.handlers:
+                    handler(self)
+            except InterpretError:
+                if stats is not None:
+                    stats.insts -= self.not_executed(block.instructions, block.start)
+                raise
+
+    def start_of(self, instr: Instruction) -> int:
+        """Index of failed instruction, `ip` can be at a later part of superinstruction"""
+        index = self.ip
+        while self.program[index] is not instr:
+            index -= 1
+        return index
+
+    def not_executed(self, instructions: list, start: int) -> int:
+        """Weight of instructions which were counted in advance, but not executed because one at `ip` failed
+
+        `instructions` were run from index `start`. Superinstruction moves
+        `ip` to every part of its sequence before the part runs, so its parts
+        after the failed one are not executed either.
+        """
+        index = start
+        for position, instr in enumerate(instructions):
+            end = index + length(instr)
+            if self.ip < end:
+                following = instructions[position + 1:]
+                return sum(instr.part_weights[self.ip - index + 1:]) + sum([instr.weight for instr in following])
+            index = end
+        return 0
+
+    def execute_profiled(self):
+        """Same as `execute`, but measures every instruction, kept apart so normal runs don't pay for it"""
+        profiler = self.profiler
+        for instr in self:
+            ip = self.ip
+            # counted before running, `EXIT` does not return
+            profiler.counts[ip] += 1
+            start = perf_counter()
+            try:
+                dispatch_table[instr.opcode_id](self)
+            except InterpretError:
+                if self.stats is not None:
+                    self.stats.insts -= self.not_executed([instr], ip)
+                raise
+            profiler.times[ip] += perf_counter() - start
+            if instr.opcode == "CALL":
+                # label name is argument of the target `LABEL` instruction
+                _, label = self.program[self.ip].args[0]
+                profiler.call(label, len(self.call_stack))
+
+
+# handlers are plain functions taking the program, so the table is built once and not for every `Program`
+opcode_handlers = {
+    "CREATEFRAME": Program.create_frame,
+    "PUSHFRAME": Program.push_frame,
+    "POPFRAME": Program.pop_frame,
+    "DEFVAR": Program.defvar,
+    "MOVE": Program.move,
+    "WRITE": Program.write,
+    "EXIT": Program.exit,
+    "PUSHS": Program.push,
+    "POPS": Program.pop,
+    "TYPE": Program.type_op,
+    "JUMP": Program.jump,
+    "JUMPIFEQ": Program.jumpifeq,
+    "JUMPIFNEQ": Program.jumpifneq,
+    "ADD": Program.add,
+    "SUB": Program.sub,
+    "MUL": Program.mul,
+    "DIV": Program.div,
+    "IDIV": Program.idiv,
+    "READ": Program.read,
+    "CALL": Program.call,
+    "RETURN": Program.return_op,
+    "LT": Program.lt,
+    "GT": Program.gt,
+    "EQ": Program.eq,
+    "AND": Program.and_op,
+    "OR": Program.or_op,
+    "NOT": Program.not_op,
+    "DPRINT": Program.dprint,
+    "BREAK": Program.break_op,
+    "LABEL": Program.label_op,
+    "INT2CHAR": Program.int_to_char,
+    "STRI2INT": Program.stri_to_int,
+    "INT2FLOAT": Program.int_to_float,
+    "FLOAT2INT": Program.float_to_int,
+    "CONCAT": Program.concat,
+    "STRLEN": Program.strlen,
+    "GETCHAR": Program.get_char,
+    "SETCHAR": Program.set_char,
+    "CLEARS": Program.clears,
+    "ADDS": Program.adds,
+    "SUBS": Program.subs,
+    "MULS": Program.muls,
+    "IDIVS": Program.idivs,
+    "DIVS": Program.divs,
+    "LTS": Program.lts,
+    "GTS": Program.gts,
+    "EQS": Program.eqs,
+    "ANDS": Program.ands,
+    "ORS": Program.ors,
+    "NOTS": Program.nots_op,
+    "INT2CHARS": Program.int_to_chars,
+    "STRI2INTS": Program.stri_to_ints,
+    "JUMPIFEQS": Program.jumpifeqs,
+    "JUMPIFNEQS": Program.jumpifneqs,
+    "PUSHS+PUSHS+OPS+POPS": Program.push_push_op_pop,
+    "PUSHS+PUSHS+OPS": Program.push_push_op,
+    "PUSHS+PUSHS+JUMPIFS": Program.push_push_jumpifs,
+    "PUSHS+OPS": Program.push_op,
+    "OPS+POPS": Program.op_pop,
+    "COMPARE+JUMPIF": Program.compare_jumpif,
+    "DEFVAR+MOVE": Program.defvar_move,
+    "CREATEFRAME+PUSHFRAME": Program.create_push_frame,
+}
+# indexed by opcode id, so dispatch is a single list lookup
+dispatch_table = [opcode_handlers[opcode] for opcode in (*opcodes, *fused_opcodes)]
+
+# operations of superinstructions by opcode of the replaced instruction
+stack_operations = {
+    "ADDS": Program._add_op,
+    "SUBS": Program._sub_op,
+    "MULS": Program._mul_op,
+    "IDIVS": Program._idiv_op,
+    "DIVS": Program._div_op,
+    "LTS": Program._lt_op,
+    "GTS": Program._gt_op,
+    "EQS": Program._eq_op,
+    "ANDS": Program._and_op,
+    "ORS": Program._or_op,
+    "STRI2INTS": Program._stri_to_int_op,
+}
+comparisons = {
+    "LT": Program._lt_op,
+    "GT": Program._gt_op,
+    "EQ": Program._eq_op,
+}
+
+
+def optimize_code(code: Code) -> Code:
+    """Optimizations enabled with `--optimize`, cached program is stored unoptimized"""
+    import peephole
+    import simplify
+
+    # pure instructions are evaluated on empty program with one global variable for results
+    scratch = Program(Code([], ["result"], []), None, stdin=io.StringIO(), stdout=io.StringIO(), stderr=io.StringIO())
+    simplify.simplify(code, scratch.evaluate)
+    return peephole.optimize(code)
+
+
+def load_source(source: str, cache_directory: str) -> Code:
+    """Decodes source, program decoded by earlier run is taken from cache if it is enabled"""
+    # modules are imported only when they are needed, cached program doesn't need XML parser
+    cache = None
+    if cache_directory is not None:
+        from cache import ProgramCache
+
+        cache = ProgramCache(cache_directory)
+        key = cache.key(source)
+        code = cache.load(key)
+        if code is not None:
+            return code
+
+    import xml.etree.ElementTree as Et
 
-def main():
-    src, stats = parse_args()
-    code = src.read()
     try:
-        xml = Et.fromstring(code)
+        xml = Et.fromstring(source)
     except Et.ParseError:
         Error.ERR_XML_PARSE.exit()
         # added so pycharm wont show warning
         return
 
-    check_xml(xml)
-    program = Program(xml, stats)
-    program.execute()
+    code = decode_program(xml)
+    if cache is not None:
+        cache.store(key, code)
+    return code
+
+
+class Result:
+    """Outcome of program that ended without error, errors are raised as `InterpretError`"""
+    def __init__(self, rc: int, stats: Stats):
+        # 0 or value of `EXIT` instruction
+        self.rc = rc
+        self.stats = stats
+
+
+def execute(code: Code, stdin, stdout, stderr, stats: Stats = None, unbuffered: bool = False,
+            profiler: Profiler = None, jit_enabled: bool = True, translated: dict = None) -> Result:
+    program = Program(code, stats, unbuffered, profiler, stdin, stdout, stderr, jit_enabled, translated)
+    try:
+        program.execute()
+    except ProgramExit as e:
+        return Result(e.code, stats)
+    finally:
+        # output written before error must not get lost
+        stdout.flush()
+    return Result(0, stats)
+
+
+def run(program_xml, stdin, stdout, stats: Stats = None, stderr=None, cache_directory: str = None,
+        optimize: bool = False, jit_enabled: bool = True, stream: bool = False) -> Result:
+    """Interprets program given as XML text with injected streams
+
+    Nothing is printed about errors and process is not ended, errors are
+    raised as subclasses of `InterpretError`. `stderr` receives output of
+    `DPRINT` and `BREAK`, standard error output is used if it is `None`.
+    Stats with `path` set to `None` are only collected, not written to file.
+    `optimize` runs peephole optimizer on the program, `jit_enabled` compiles
+    hot blocks and `stream` decodes the program incrementally like `--stream`.
+    """
+    stderr = sys.stderr if stderr is None else stderr
+    if stream:
+        code = load_stream(io.StringIO(program_xml))
+    else:
+        code = load_source(program_xml, cache_directory)
+    if optimize:
+        optimize_code(code)
+    print_info(code.name, code.description, stderr)
+    return execute(code, stdin, stdout, stderr, stats, jit_enabled=jit_enabled)
+
+
+def translate_source(source: str, cache_directory: str, optimize: bool):
+    """Returns module of program translated by `aot`, module is cached like decoded programs"""
+    import aot
+
+    cache = None
+    if cache_directory is not None:
+        from cache import ProgramCache
+
+        cache = ProgramCache(cache_directory)
+        key = cache.module_key(source, optimize)
+        module = cache.load_module(key)
+        if module is not None:
+            return module
+
+    code = load_source(source, cache_directory)
+    if optimize:
+        optimize_code(code)
+    translated = aot.translate(code, dispatch_table)
+    if cache is not None:
+        cache.store_module(key, translated)
+        module = cache.load_module(key)
+        if module is not None:
+            return module
+    return aot.load(translated)
+
+
+def load_program(opts: Options):
+    """Returns decoded program given by arguments and functions of its blocks if it is translated"""
+    if opts.aot and not opts.stream:
+        module = translate_source(opts.source.read(), opts.cache, opts.optimize)
+        return module.code, module.blocks
+
+    code = load_stream(opts.source) if opts.stream else load_source(opts.source.read(), opts.cache)
+    if opts.optimize:
+        optimize_code(code)
+    if opts.aot:
+        import aot
+
+        return code, aot.load(aot.translate(code, dispatch_table)).blocks
+    return code, None
+
+
+def emit_python(code: Code, path: str):
+    import aot
+
+    try:
+        with open(path, "w") as file:
+            file.write(aot.translate(code, dispatch_table))
+    except OSError:
+        Error.ERR_OUTPUT.exit()
+
+
+def main(code: Code = None, translated: dict = None):
+    """Runs program given by arguments, module translated by `aot` passes its program and blocks instead"""
+    opts = None
+    try:
+        opts = parse_args(code is not None)
+        if code is None:
+            if opts.emit_python is not None:
+                code, _ = load_program(opts)
+                emit_python(code, opts.emit_python)
+                return
+            code, translated = load_program(opts)
+        print_info(code.name, code.description)
+        profiler = Profiler(opts.profile, code.instructions) if opts.profile is not None else None
+        result = execute(code, opts.input, opts.output, sys.stderr, opts.stats, opts.unbuffered, profiler, opts.jit,
+                         translated)
+    except InterpretError as e:
+        if opts is not None:
+            opts.output.flush()
+        e.exit()
+        # added so pycharm wont show warning
+        return
+    exit(result.rc)
 
 
 if __name__ == "__main__":
+    # translated programs import this module, they must get the running one with the same classes
+    sys.modules["interpret"] = sys.modules[__name__]
     main()
@@ -0,0 +1,428 @@
+"""Compilation of hot basic blocks to Python functions
+
+Block which was executed `THRESHOLD` times is translated to Python source,
+compiled and from then on run as one function. Variables are read directly
+from frames, constant operands are inlined and the most common instructions
+(integer arithmetic and comparisons, `MOVE`, conditional jumps and stack
+operations) have their type checks inlined. If a check fails (other types,
+undefined variable, missing frame or empty stack), the instruction is run by
+its method in `Program` instead, which handles the other types or reports
+the exact error. Other instructions always run their method. Block which
+jumps back to its own start is compiled to a loop, so its iterations don't
+return to the interpreter.
+"""
+from var import *
+# inlined `Var.of_int`
+from var import _small_ints
+from cfg import BRANCHES, length
+
+# number of executions of block after which it is compiled
+THRESHOLD = 50
+
+ARITHMETIC = {"ADD": "+", "SUB": "-", "MUL": "*", "ADDS": "+", "SUBS": "-", "MULS": "*"}
+ORDERING = {"LT": "<", "GT": ">", "LTS": "<", "GTS": ">"}
+
+# names of types in generated code
+type_names = {
+    VarType.BOOL: "BOOL",
+    VarType.INT: "INT",
+    VarType.STRING: "STRING",
+    VarType.NIL: "NIL",
+    VarType.UNDEF: "UNDEF",
+    VarType.FLOAT: "FLOAT",
+}
+
+
+class BlockCompiler:
+    """Generates source of function which runs block with program as its argument"""
+    def __init__(self, block, handlers: list, stats):
+        self.block = block
+        self.handlers = handlers
+        self.stats = stats
+        # block jumps back to its start
+        self.loop = block.start in block.successors
+        self.lines = []
+        self.depth = 1
+        self.namespace = {name: var_type for var_type, name in type_names.items()}
+        self.namespace.update({"Var": Var, "StrVar": StrVar, "TRUE": Var.TRUE, "FALSE": Var.FALSE,
+                               "small": _small_ints, "stats": stats})
+
+    def emit(self, line: str):
+        self.lines.append("    " * self.depth + line)
+
+    def constant(self, var: Var) -> str:
+        """Returns expression of constant value"""
+        if var.var_type == VarType.INT or var.var_type == VarType.BOOL:
+            return repr(var.value)
+        return self.name(var) + ".value"
+
+    def name(self, value) -> str:
+        """Adds object to namespace of generated code"""
+        name = "k" + str(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    @staticmethod
+    def frame(scope: str) -> str:
+        if scope == "GF":
+            return "gf"
+        elif scope == "LF":
+            return "frames[-1]"
+        return "program.temp_frame"
+
+    @staticmethod
+    def read(symbol_value) -> str:
+        """Expression of variable, `None` if it is not defined or its frame doesn't exist"""
+        scope, slot = symbol_value
+        if scope == "GF":
+            return "gf[" + repr(slot) + "]"
+        elif scope == "LF":
+            return "(frames[-1][" + repr(slot) + "] if frames else None)"
+        return "(program.temp_frame[" + repr(slot) + "] if program.temp_frame is not None else None)"
+
+    def store(self, symbol_value, expression: str):
+        scope, slot = symbol_value
+        self.emit(BlockCompiler.frame(scope) + "[" + repr(slot) + "] = " + expression)
+
+    def symbol(self, arg: tuple, name: str, var_type: VarType):
+        """Loads operand of type `var_type` to local `name`
+
+        Returns expression of its value and conditions of fast path, `None` if
+        it is a constant of other type.
+        """
+        arg_type, value = arg
+        if arg_type == "var":
+            self.emit(name + " = " + BlockCompiler.read(value))
+            return name + ".value", [name + " is not None", name + ".var_type is " + type_names[var_type]]
+        if value.var_type != var_type:
+            return None
+        return self.constant(value), []
+
+    def equality(self, arg_1: tuple, arg_2: tuple):
+        """Returns expression of equality of operands and conditions of fast path, `None` if there is none
+
+        Fast path only compares values of the same type, `nil` with other types is left to `Program._equal`.
+        """
+        if arg_1[0] != "var" and arg_2[0] != "var":
+            return None
+        if arg_1[0] != "var":
+            arg_1, arg_2 = arg_2, arg_1
+        if arg_2[0] != "var":
+            if arg_2[1].var_type == VarType.NIL:
+                return None
+            value_1, conditions = self.symbol(arg_1, "a", arg_2[1].var_type)
+            return value_1 + " == " + self.constant(arg_2[1]), conditions
+
+        self.emit("a = " + BlockCompiler.read(arg_1[1]))
+        self.emit("b = " + BlockCompiler.read(arg_2[1]))
+        return "a.value == b.value", ["a is not None", "b is not None", "a.var_type is b.var_type",
+                                      "a.var_type is not UNDEF"]
+
+    def defined(self, target, args: list) -> list:
+        """Conditions of fast path for target variable, it must be defined"""
+        if any(arg_type == "var" and value == target for arg_type, value in args):
+            # checked with operand
+            return []
+        self.emit("t = " + BlockCompiler.read(target))
+        return ["t is not None"]
+
+    @staticmethod
+    def int_var(expression: str) -> str:
+        return "small[{0} + {1}] if {2} <= {0} < {3} else Var(INT, {0})".format(
+            expression, -SMALL_INT_MIN, SMALL_INT_MIN, SMALL_INT_MAX)
+
+    def fast_path(self, conditions: list):
+        """Starts fast path, `otherwise` must follow after its body"""
+        self.emit("if " + " and ".join(conditions) + ":")
+        self.depth += 1
+
+    def otherwise(self, instr, index: int):
+        """Runs instruction by its method if conditions of fast path don't hold"""
+        self.depth -= 1
+        self.emit("else:")
+        self.depth += 1
+        if instr.opcode in BRANCHES:
+            self.branch_generic(instr, index)
+        else:
+            self.generic(instr, index)
+        self.depth -= 1
+
+    def generic(self, instr, index: int):
+        """Runs instruction by its method in `Program`, `ip` is set for it"""
+        self.emit("program.ip = " + str(index))
+        self.emit(self.name(self.handlers[instr.opcode_id]) + "(program)")
+        if instr.opcode == "CLEARS":
+            # the only instruction which replaces the stack
+            self.emit("stack = program.data_stack")
+
+    def goto(self, target: int):
+        """Continues at instruction with index `target`"""
+        if self.loop and target == self.block.start:
+            self.count()
+            self.emit("continue")
+        else:
+            self.emit("program.ip = " + str(target))
+            self.emit("return")
+
+    def count(self):
+        """Counts instructions of the next iteration of loop, interpreter counts the first one"""
+        if self.stats is not None:
+            self.emit("stats.insts += " + str(self.block.weight))
+
+    def branch(self, condition: str, target: int):
+        self.emit("if " + condition + ":")
+        self.depth += 1
+        self.goto(target)
+        self.depth -= 1
+        self.goto(self.block.end)
+
+    def branch_generic(self, instr, index: int):
+        """Branch instruction run by its method, which sets `ip`"""
+        self.generic(instr, index)
+        if self.loop:
+            self.emit("if program.ip == " + str(self.block.start) + ":")
+            self.depth += 1
+            self.count()
+            self.emit("continue")
+            self.depth -= 1
+        self.emit("return")
+
+    def preamble(self):
+        """Loads state of program used by generated code to locals"""
+        self.emit("gf = program.global_frame")
+        self.emit("frames = program.frames")
+        self.emit("stack = program.data_stack")
+
+    def source(self, name: str) -> str:
+        """Returns source of function `name` which runs the block"""
+        self.preamble()
+        if self.loop:
+            self.emit("while True:")
+            self.depth += 1
+
+        index = self.block.start
+        branched = False
+        for instr in self.block.instructions:
+            self.emit("# " + instr.opcode + " " + str(index))
+            branched = self.instruction(instr, index)
+            index += length(instr)
+        if not branched:
+            self.goto(self.block.end)
+
+        return "def " + name + "(program):\n" + "\n".join(self.lines) + "\n"
+
+    def compile(self):
+        exec(compile(self.source("block"), "<block {}>".format(self.block.start), "exec"), self.namespace)
+        return self.namespace["block"]
+
+    def instruction(self, instr, index: int) -> bool:
+        """Generates code of instruction, returns whether it is a branch which ends generated code"""
+        opcode = instr.opcode
+        args = instr.args
+        if opcode == "LABEL":
+            return False
+        elif opcode == "JUMP":
+            self.goto(args[0][1])
+            return True
+        elif opcode in ("ADD", "SUB", "MUL", "LT", "GT"):
+            self.binary(instr, index)
+        elif opcode == "EQ":
+            (_, target), arg_1, arg_2 = args
+            equal = self.equality(arg_1, arg_2)
+            if equal is None:
+                self.generic(instr, index)
+                return False
+            self.fast_path(self.defined(target, [arg_1, arg_2]) + equal[1])
+            self.store(target, "TRUE if " + equal[0] + " else FALSE")
+            self.otherwise(instr, index)
+        elif opcode == "MOVE":
+            self.move(instr, index)
+        elif opcode in ("JUMPIFEQ", "JUMPIFNEQ"):
+            (_, target), arg_1, arg_2 = args
+            equal = self.equality(arg_1, arg_2)
+            if equal is None:
+                self.branch_generic(instr, index)
+                return True
+            self.fast_path(equal[1])
+            self.branch(equal[0] if opcode == "JUMPIFEQ" else "not " + equal[0], target)
+            self.otherwise(instr, index)
+            return True
+        elif opcode == "COMPARE+JUMPIF":
+            return self.compare_jumpif(instr, index)
+        elif opcode == "PUSHS":
+            self.push(instr, index)
+        elif opcode == "POPS":
+            (_, target), = args
+            self.fast_path(["stack"] + self.defined(target, []))
+            self.store(target, "stack.pop()")
+            self.otherwise(instr, index)
+        elif opcode in ARITHMETIC or opcode in ORDERING:
+            self.stack_operation(instr, index)
+        elif opcode in ("JUMPIFEQS", "JUMPIFNEQS"):
+            (_, target), = args
+            self.fast_path(["len(stack) > 1", "stack[-1].var_type is stack[-2].var_type",
+                            "stack[-1].var_type is not UNDEF"])
+            self.emit("b = stack.pop()")
+            self.emit("a = stack.pop()")
+            self.branch("a.value == b.value" if opcode == "JUMPIFEQS" else "a.value != b.value", target)
+            self.otherwise(instr, index)
+            return True
+        elif opcode == "PUSHS+PUSHS+OPS+POPS":
+            self.push_push_op_pop(instr, index)
+        elif opcode == "PUSHS+PUSHS+OPS":
+            self.push_push_op(instr, index)
+        elif opcode == "PUSHS+OPS":
+            self.push_op(instr, index)
+        elif opcode == "OPS+POPS":
+            self.op_pop(instr, index)
+        elif opcode == "PUSHS+PUSHS+JUMPIFS":
+            (_, target), arg_1, arg_2, (_, expected) = args
+            equal = self.equality(arg_1, arg_2)
+            if equal is None:
+                self.branch_generic(instr, index)
+                return True
+            self.fast_path(equal[1])
+            self.branch(equal[0] if expected else "not " + equal[0], target)
+            self.otherwise(instr, index)
+            return True
+        elif opcode in BRANCHES:
+            self.branch_generic(instr, index)
+            return True
+        else:
+            self.generic(instr, index)
+        return False
+
+    def operation(self, opcode: str, value_1: str, value_2: str) -> str:
+        """Returns expression of result of arithmetic or comparison of integer values"""
+        if opcode in ARITHMETIC:
+            self.emit("v = " + value_1 + " " + ARITHMETIC[opcode] + " " + value_2)
+            return BlockCompiler.int_var("v")
+        return "TRUE if " + value_1 + " " + ORDERING[opcode] + " " + value_2 + " else FALSE"
+
+    def binary(self, instr, index: int):
+        """ADD, SUB, MUL, LT and GT of integers"""
+        (_, target), arg_1, arg_2 = instr.args
+        value_1 = self.symbol(arg_1, "a", VarType.INT)
+        value_2 = self.symbol(arg_2, "b", VarType.INT)
+        if value_1 is None or value_2 is None:
+            self.generic(instr, index)
+            return
+        self.fast_path(self.defined(target, [arg_1, arg_2]) + value_1[1] + value_2[1])
+        self.store(target, self.operation(instr.opcode, value_1[0], value_2[0]))
+        self.otherwise(instr, index)
+
+    def move(self, instr, index: int):
+        (_, target), (source_type, source_value) = instr.args
+        if source_type == "var":
+            self.emit("s = " + BlockCompiler.read(source_value))
+            self.fast_path(self.defined(target, []) + ["s is not None", "s.var_type is not UNDEF"])
+            self.emit("if s.__class__ is StrVar:")
+            self.emit("    s.shared = True")
+            self.store(target, "s")
+        else:
+            self.fast_path(self.defined(target, []))
+            self.store(target, self.name(source_value))
+        self.otherwise(instr, index)
+
+    def push(self, instr, index: int):
+        (source_type, source_value), = instr.args
+        if source_type != "var":
+            self.emit("stack.append(" + self.name(source_value) + ")")
+            return
+        self.emit("s = " + BlockCompiler.read(source_value))
+        self.fast_path(["s is not None", "s.var_type is not UNDEF"])
+        self.emit("if s.__class__ is StrVar:")
+        self.emit("    s.shared = True")
+        self.emit("stack.append(s)")
+        self.otherwise(instr, index)
+
+    def stack_operation(self, instr, index: int):
+        """ADDS, SUBS, MULS, LTS and GTS of integers"""
+        self.fast_path(["len(stack) > 1", "stack[-1].var_type is INT", "stack[-2].var_type is INT"])
+        self.emit("b = stack.pop()")
+        self.emit("stack[-1] = " + self.operation(instr.opcode, "stack[-1].value", "b.value"))
+        self.otherwise(instr, index)
+
+    def fused_operands(self, instr, index: int, pushed: list):
+        """Loads integer operands pushed by superinstruction, `None` if it is run by its method"""
+        operation = instr.args[0][1]
+        values = [self.symbol(arg, name, VarType.INT) for arg, name in zip(pushed, ("a", "b"))]
+        if (operation not in ARITHMETIC and operation not in ORDERING) or None in values:
+            self.generic(instr, index)
+            return None
+        return values
+
+    def push_push_op_pop(self, instr, index: int):
+        """PUSHS a; PUSHS b; ADDS; POPS x of integers"""
+        (_, operation), arg_1, arg_2, (_, target) = instr.args
+        values = self.fused_operands(instr, index, [arg_1, arg_2])
+        if values is None:
+            return
+        self.fast_path(values[0][1] + values[1][1] + self.defined(target, [arg_1, arg_2]))
+        self.store(target, self.operation(operation, values[0][0], values[1][0]))
+        self.otherwise(instr, index)
+
+    def push_push_op(self, instr, index: int):
+        """PUSHS a; PUSHS b; ADDS of integers"""
+        (_, operation), arg_1, arg_2 = instr.args
+        values = self.fused_operands(instr, index, [arg_1, arg_2])
+        if values is None:
+            return
+        conditions = values[0][1] + values[1][1]
+        if not conditions:
+            # constant operands can't fail
+            self.emit("stack.append(" + self.operation(operation, values[0][0], values[1][0]) + ")")
+            return
+        self.fast_path(conditions)
+        self.emit("stack.append(" + self.operation(operation, values[0][0], values[1][0]) + ")")
+        self.otherwise(instr, index)
+
+    def push_op(self, instr, index: int):
+        """PUSHS b; ADDS of integers"""
+        (_, operation), arg_2 = instr.args
+        values = self.fused_operands(instr, index, [arg_2])
+        if values is None:
+            return
+        self.fast_path(values[0][1] + ["stack", "stack[-1].var_type is INT"])
+        self.emit("stack[-1] = " + self.operation(operation, "stack[-1].value", values[0][0]))
+        self.otherwise(instr, index)
+
+    def op_pop(self, instr, index: int):
+        """ADDS; POPS x of integers"""
+        (_, operation), (_, target) = instr.args
+        if operation not in ARITHMETIC and operation not in ORDERING:
+            self.generic(instr, index)
+            return
+        self.fast_path(["len(stack) > 1", "stack[-1].var_type is INT", "stack[-2].var_type is INT"] +
+                       self.defined(target, []))
+        self.emit("b = stack.pop()")
+        self.emit("a = stack.pop()")
+        self.store(target, self.operation(operation, "a.value", "b.value"))
+        self.otherwise(instr, index)
+
+    def compare_jumpif(self, instr, index: int) -> bool:
+        """LT t a b; JUMPIFEQ L t bool@true of integers, or EQ of values of the same type"""
+        (_, target), (_, dest), arg_1, arg_2, (_, operation), (_, expected) = instr.args
+        if operation == "EQ":
+            compared = self.equality(arg_1, arg_2)
+        else:
+            value_1 = self.symbol(arg_1, "a", VarType.INT)
+            value_2 = self.symbol(arg_2, "b", VarType.INT)
+            compared = None
+            if value_1 is not None and value_2 is not None:
+                compared = value_1[0] + " " + ORDERING[operation] + " " + value_2[0], value_1[1] + value_2[1]
+        if compared is None:
+            self.branch_generic(instr, index)
+            return True
+
+        self.fast_path(self.defined(dest, [arg_1, arg_2]) + compared[1])
+        self.emit("r = " + compared[0])
+        self.store(dest, "TRUE if r else FALSE")
+        self.branch("r" if expected else "not r", target)
+        self.otherwise(instr, index)
+        return True
+
+
+def compile_block(block, handlers: list, stats):
+    """Returns function running `block`, `handlers` are methods of `Program` indexed by opcode id"""
+    return BlockCompiler(block, handlers, stats).compile()
@@ -1,19 +1,43 @@
 from enum import Enum
-from typing import Iterable
+import os
 import re
 
 from error import *
 from helper import *
 
+# `True` if argument takes a value, `None` if the value is optional
 arg_types = {
     "help": False,
     "source": True,
     "input": True,
     "stats": True,
     "insts": False,
-    "vars": False
+    "vars": False,
+    "buffer": True,
+    "unbuffered": False,
+    "profile": True,
+    "stream": False,
+    "cache": None,
+    "no-cache": False,
+    "optimize": False,
+    "no-jit": False,
+    "emit-python": True,
+    "aot": False,
 }
 
+# arguments selecting the source, translated program (see `aot`) has its own
+source_args = frozenset(("source", "stream", "optimize", "emit-python", "aot"))
+
+# default size of output buffer in bytes
+DEFAULT_BUFFER_SIZE = 65536
+# buffer of size 1 would mean line buffering for text stream
+MIN_BUFFER_SIZE = 2
+
+
+def default_cache_directory() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ipp-interpret")
+
 
 class Stat(Enum):
     INSTS = 0,
@@ -21,17 +45,53 @@ class Stat(Enum):
 
 
 class Stats:
-    def __init__(self, path: str, opts: Iterable[Stat]):
+    def __init__(self, path: str, opts: list):
         self.path = path
         self.opts = opts
         self.insts = 0
+        # highest number of defined variables
         self.vars = 0
+        # currently defined variables in all frames
+        self.live_vars = 0
+
+    def add_var(self):
+        self.live_vars += 1
+        if self.live_vars > self.vars:
+            self.vars = self.live_vars
+
+    def drop_vars(self, count: int):
+        self.live_vars -= count
 
     def __repr__(self):
         return 'Stats = {{path: "{self.path}", opts: "{self.opts}", insts: {self.insts}, vars: {self.vars}}}'.format(self=self)
 
 
-def parse_args():
+class Options:
+    def __init__(self, source, input_stream, output, stats: Stats, unbuffered: bool, profile: str, stream: bool,
+                 cache: str, optimize: bool, jit: bool, emit_python: str, aot: bool):
+        self.source = source
+        # input and output of interpreted program
+        self.input = input_stream
+        self.output = output
+        self.stats = stats
+        self.unbuffered = unbuffered
+        self.stream = stream
+        # directory of decoded program cache, `None` if disabled
+        self.cache = cache
+        # path to profiler report
+        self.profile = profile
+        # run peephole optimizer
+        self.optimize = optimize
+        # compile hot blocks
+        self.jit = jit
+        # path where program translated to Python is written instead of running it
+        self.emit_python = emit_python
+        # run program translated to Python
+        self.aot = aot
+
+
+def parse_args(translated: bool = False) -> Options:
+    """Parses arguments of interpreter, `translated` program is run without source"""
     args = sys.argv[1:]
     inp = sys.stdin
     src = sys.stdin
@@ -42,8 +102,19 @@ def parse_args():
 
     found_input = False
 
+    buffer_size = None
+    unbuffered = False
+    profile = None
+    stream = False
+    cache = None
+    no_cache = False
+    optimize = False
+    jit = True
+    emit_python = None
+    aot = False
+
     # splits argument into name and optional path
-    arg_format = re.compile(r'^--?([a-zA-Z]+)(?:$|=([\S]+))$')
+    arg_format = re.compile(r'^--?([a-zA-Z-]+)(?:$|=([\S]+))$')
 
     for arg in args:
         try:
@@ -55,11 +126,11 @@ def parse_args():
             return
 
         # check for unknown arg
-        if name not in arg_types:
+        if name not in arg_types or (translated and name in source_args):
             Error.ERR_ARGS.exit()
 
         # check if path missing
-        if arg_types[name] != (len(path) != 0):
+        if arg_types[name] is not None and arg_types[name] != (len(path) != 0):
             Error.ERR_ARGS.exit()
 
         try:
@@ -81,115 +152,172 @@ def parse_args():
             elif name == "stats":
                 found_stats = True
                 stat_file = path
+            elif name == "buffer":
+                buffer_size = int(path)
+                if buffer_size < MIN_BUFFER_SIZE:
+                    Error.ERR_ARGS.exit()
+            elif name == "unbuffered":
+                unbuffered = True
+            elif name == "profile":
+                profile = path
+            elif name == "stream":
+                stream = True
+            elif name == "cache":
+                # cache is only used when it is requested
+                cache = path or default_cache_directory()
+            elif name == "no-cache":
+                no_cache = True
+            elif name == "optimize":
+                optimize = True
+            elif name == "no-jit":
+                jit = False
+            elif name == "emit-python":
+                emit_python = path
+            elif name == "aot":
+                aot = True
         except OSError:
             Error.ERR_INPUT.exit()
+        except ValueError:
+            # buffer size is not a number
+            Error.ERR_ARGS.exit()
 
     # source or input was not found
-    if not found_input:
+    if not found_input and not translated:
         Error.ERR_ARGS.exit()
 
     # stats args without --stats
     if not found_stats and len(stat_opts) != 0:
         Error.ERR_ARGS.exit()
 
+    # buffer size makes no sense without buffer
+    if unbuffered and buffer_size is not None:
+        Error.ERR_ARGS.exit()
+
+    if no_cache and cache is not None:
+        Error.ERR_ARGS.exit()
+
+    # translated program is written, not run
+    if emit_python is not None and (aot or profile is not None):
+        Error.ERR_ARGS.exit()
+    # profiler measures single instructions
+    if aot and profile is not None:
+        Error.ERR_ARGS.exit()
+
     if found_stats:
         stats = Stats(stat_file, stat_opts)
     else:
         stats = None
 
-    sys.stdin = inp
-    return src, stats
+    output = sys.stdout
+    if not unbuffered:
+        # output is flushed explicitly, not after every `WRITE`
+        output = open(sys.stdout.fileno(), "w", buffering=buffer_size or DEFAULT_BUFFER_SIZE,
+                      encoding=sys.stdout.encoding, closefd=False)
+    return Options(src, inp, output, stats, unbuffered, profile, stream, cache, optimize, jit, emit_python, aot)
+
+
+# valid text of argument by its type
+arg_pattern_sources = {
+    "var": r"^(GF|TF|LF)@[_\-$&%*!?a-zA-Z][\-$&%*!?\w]*$",
+    "string": r"^(([^\s#@\\]|(\\[0-9]{3}))*)$",
+    "nil": r"^nil$",
+    "bool": r"^(true|false)$",
+    "int": r"^[-+]?[0-9]+$",
+    "float": r"^[-+]?(?:0x)?[0-9a-f]?\.?[0-9a-f]*(?:p(?:0|[+-][0-9]+))?$",
+    "label": r"^[_\-$&%*!?a-zA-Z][\-$&%*!?\w]*$",
+    "type": r"^(bool|string|int|float)$",
+}
+
+
+class ArgPatterns(dict):
+    """Patterns compiled on first use, programs loaded from cache are not checked at all"""
+    def __missing__(self, arg_type):
+        pattern = self[arg_type] = re.compile(arg_pattern_sources[arg_type])
+        return pattern
+
+
+arg_patterns = ArgPatterns()
+
+symbol_types = frozenset(("var", "string", "nil", "bool", "int", "float"))
+
+# allowed values of `type` attribute for every argument of opcode
+opcode_arg_types = {
+    opcode: tuple(symbol_types if arg == ArgType.SYMBOL else frozenset((str(arg),)) for arg in args)
+    for opcode, args in opcodes.items()
+}
+
+# index of argument by its tag
+arg_tags = {"arg1": 0, "arg2": 1, "arg3": 2}
 
 
-def check_xml(program):
-    # check root node
+def check_root(program):
     if program.get("language") != "IPPcode20" or program.tag != "program":
         Error.ERR_XML_STRUCT.exit()
-    if program.get("name") is not None:
-        eprint("Name:   " + program.get("name"))
-    if program.get("description") is not None:
-        eprint("Desc:   " + program.get("description"))
-
-    orders = set()
-
-    for instr in program:
-        opcode = instr.get("opcode")
-        order = instr.get("order")
-        # check for invalid structure
-        if instr.tag != "instruction" or order is None or opcode is None:
-            Error.ERR_XML_STRUCT.exit()
 
-        # opcode dict has opcodes in uppercase
-        opcode = opcode.upper()
 
-        # check duplicate orders
-        if order in orders:
-            Error.ERR_XML_STRUCT.exit()
-        orders.add(order)
+def print_info(name, description, file=None):
+    """Prints name and description of program given in root element"""
+    if name is not None:
+        eprint("Name:   " + name, file=file)
+    if description is not None:
+        eprint("Desc:   " + description, file=file)
 
-        try:
-            # check if positive number
-            if int(order) < 1:
-                Error.ERR_XML_STRUCT.exit()
-        except ValueError:
-            # check if number
-            Error.ERR_XML_STRUCT.exit()
 
-        # check unknown opcode
-        if opcode not in opcodes:
-            Error.ERR_XML_STRUCT.exit()
+def check_instruction(instr, orders: set) -> tuple:
+    """Checks one `<instruction>` element, returns `(opcode, order, [(type, text), ...])`
 
-        # check corrupted opcode
-        if len(instr) != len(opcodes[opcode]):
-            Error.ERR_XML_STRUCT.exit()
+    `orders` holds orders of already checked instructions.
+    """
+    opcode = instr.get("opcode")
+    order = instr.get("order")
+    # check for invalid structure
+    if instr.tag != "instruction" or order is None or opcode is None:
+        Error.ERR_XML_STRUCT.exit()
 
-        # check opcode arg nodes
-        for i in range(len(opcodes[opcode])):
-            arg = instr.find("arg" + str(i + 1))
-            if arg is None:
-                Error.ERR_XML_STRUCT.exit()
+    # opcode dict has opcodes in uppercase
+    opcode = opcode.upper()
 
-            arg_type = arg.get("type")
+    # check duplicate orders
+    if order in orders:
+        Error.ERR_XML_STRUCT.exit()
+    orders.add(order)
 
-            if arg_type is None:
-                Error.ERR_XML_STRUCT.exit()
+    try:
+        order = int(order)
+    except ValueError:
+        # check if number
+        Error.ERR_XML_STRUCT.exit()
+    # check if positive number
+    if order < 1:
+        Error.ERR_XML_STRUCT.exit()
 
-            if opcodes[opcode][i] == ArgType.SYMBOL:
-                # check symbols
-                if arg_type == "var" or arg_type == "string" or arg_type == "nil" or arg_type == "bool" or arg_type == "int" or arg_type == "float":
-                    pass
-                else:
-                    Error.ERR_XML_STRUCT.exit()
-            elif str(opcodes[opcode][i]) != arg_type:
-                # wrong type in `type` tag
-                Error.ERR_XML_STRUCT.exit()
+    # check unknown opcode
+    expected_types = opcode_arg_types.get(opcode)
+    if expected_types is None:
+        Error.ERR_XML_STRUCT.exit()
 
-            # only string can have empty text element
-            if arg_type != "string" and arg.text is None:
-                Error.ERR_XML_STRUCT.exit()
-            elif arg_type == "string" and arg.text is None:
-                continue
-
-            # check valid format of text element
-            if arg_type == "var":
-                pattern = re.compile(r"^(GF|TF|LF)@[_\-$&%*!?a-zA-Z][\-$&%*!?\w]*$")
-            elif arg_type == "string":
-                pattern = re.compile(r"^(([^\s#@\\]|(\\[0-9]{3}))*)$")
-            elif arg_type == "nil":
-                pattern = re.compile(r"^nil$")
-            elif arg_type == "bool":
-                pattern = re.compile(r"^(true|false)$")
-            elif arg_type == "int":
-                pattern = re.compile(r"^[-+]?[0-9]+$")
-            elif arg_type == "float":
-                pattern = re.compile(r"^[-+]?(?:0x)?[0-9a-f]?\.?[0-9a-f]*(?:p(?:0|[+-][0-9]+))?$")
-            elif arg_type == "label":
-                pattern = re.compile(r"^[_\-$&%*!?a-zA-Z][\-$&%*!?\w]*$")
-            elif arg_type == "type":
-                pattern = re.compile(r"^(bool|string|int|float)$")
-            else:
-                Error.ERR_XML_STRUCT.exit()
+    # check corrupted opcode, children must be arg1 to argN in any order
+    args = [None] * len(expected_types)
+    if len(instr) != len(args):
+        Error.ERR_XML_STRUCT.exit()
+    for arg in instr:
+        index = arg_tags.get(arg.tag)
+        if index is None or index >= len(args) or args[index] is not None:
+            Error.ERR_XML_STRUCT.exit()
+
+        arg_type = arg.get("type")
+        if arg_type not in expected_types[index]:
+            Error.ERR_XML_STRUCT.exit()
 
-            match = pattern.search(arg.text)
-            if match is None:
+        # only string can have empty text element
+        text = arg.text
+        if text is None:
+            if arg_type != "string":
                 Error.ERR_XML_STRUCT.exit()
+        # check valid format of text element
+        elif arg_patterns[arg_type].search(text) is None:
+            Error.ERR_XML_STRUCT.exit()
+
+        args[index] = (arg_type, text)
+
+    return opcode, order, args
@@ -0,0 +1,94 @@
+"""Peephole optimizer, enabled with `--optimize`
+
+Common instruction sequences are replaced by superinstructions, which run
+the whole sequence with one dispatch. Superinstruction replaces only the first
+instruction of its sequence, the rest is left in place, so indices of jump
+targets don't change and jumps into the middle of a sequence still work.
+Superinstructions check operands and report errors in the same order as the
+original instructions. `weight` of superinstruction is number of instructions
+it replaced, so `--insts` counts the original program. If a part of the
+sequence fails, the following parts are not counted (see
+`Program.not_executed`).
+"""
+from instruction import Code, Instruction
+
+# stack instructions which pop two operands and push one result
+STACK_OPERATIONS = frozenset(("ADDS", "SUBS", "MULS", "IDIVS", "DIVS", "LTS", "GTS", "EQS", "ANDS", "ORS",
+                              "STRI2INTS"))
+COMPARISONS = frozenset(("LT", "GT", "EQ"))
+
+
+def fuse(opcode: str, sequence: list, args: tuple) -> Instruction:
+    fused = Instruction(opcode, sequence[0].order, args)
+    fused.part_weights = tuple(instr.weight for instr in sequence)
+    fused.weight = sum(fused.part_weights)
+    return fused
+
+
+def match_pushs(sequence: list):
+    push_1, *rest = sequence
+    opcodes = [instr.opcode for instr in rest]
+    if len(opcodes) >= 3 and opcodes[0] == "PUSHS" and opcodes[1] in STACK_OPERATIONS and opcodes[2] == "POPS":
+        # PUSHS a; PUSHS b; ADDS; POPS x
+        return fuse("PUSHS+PUSHS+OPS+POPS", sequence[:4],
+                    (("opcode", opcodes[1]), push_1.args[0], rest[0].args[0], rest[2].args[0]))
+    if len(opcodes) >= 2 and opcodes[0] == "PUSHS" and opcodes[1] in ("JUMPIFEQS", "JUMPIFNEQS"):
+        # PUSHS a; PUSHS b; JUMPIFEQS L
+        return fuse("PUSHS+PUSHS+JUMPIFS", sequence[:3],
+                    (rest[1].args[0], push_1.args[0], rest[0].args[0], ("bool", opcodes[1] == "JUMPIFEQS")))
+    if len(opcodes) >= 2 and opcodes[0] == "PUSHS" and opcodes[1] in STACK_OPERATIONS:
+        # PUSHS a; PUSHS b; ADDS
+        return fuse("PUSHS+PUSHS+OPS", sequence[:3], (("opcode", opcodes[1]), push_1.args[0], rest[0].args[0]))
+    if len(opcodes) >= 1 and opcodes[0] in STACK_OPERATIONS:
+        # PUSHS b; ADDS
+        return fuse("PUSHS+OPS", sequence[:2], (("opcode", opcodes[0]), push_1.args[0]))
+    return None
+
+
+def match_compare(sequence: list):
+    """LT t a b; JUMPIFEQ L t bool@true, constant can be on either side and `JUMPIFNEQ` or `false` negates it"""
+    if len(sequence) < 2 or sequence[1].opcode not in ("JUMPIFEQ", "JUMPIFNEQ"):
+        return None
+    compare, jump = sequence[:2]
+    target, arg_1, arg_2 = jump.args
+    if arg_1 == compare.args[0] and arg_2[0] == "bool":
+        constant = arg_2[1]
+    elif arg_2 == compare.args[0] and arg_1[0] == "bool":
+        constant = arg_1[1]
+    else:
+        return None
+    # jump is taken if result of comparison is `expected`
+    expected = constant.value if jump.opcode == "JUMPIFEQ" else not constant.value
+    return fuse("COMPARE+JUMPIF", sequence[:2],
+                (target, compare.args[0], compare.args[1], compare.args[2], ("opcode", compare.opcode),
+                 ("bool", expected)))
+
+
+def match(sequence: list):
+    """Returns superinstruction for sequence starting with its first instruction, `None` if there is none"""
+    opcode = sequence[0].opcode
+    following = sequence[1].opcode if len(sequence) > 1 else None
+    if opcode == "PUSHS":
+        return match_pushs(sequence)
+    elif opcode in STACK_OPERATIONS and following == "POPS":
+        # ADDS; POPS x
+        return fuse("OPS+POPS", sequence[:2], (("opcode", opcode), sequence[1].args[0]))
+    elif opcode in COMPARISONS:
+        return match_compare(sequence)
+    elif opcode == "DEFVAR" and following == "MOVE" and sequence[1].args[0] == sequence[0].args[0]:
+        # DEFVAR x; MOVE x s
+        return fuse("DEFVAR+MOVE", sequence[:2], (sequence[0].args[0], sequence[1].args[1]))
+    elif opcode == "CREATEFRAME" and following == "PUSHFRAME":
+        return fuse("CREATEFRAME+PUSHFRAME", sequence[:2], ())
+    return None
+
+
+def optimize(code: Code) -> Code:
+    """Replaces first instructions of known sequences with superinstructions"""
+    program = code.instructions
+    optimized = []
+    for index, instr in enumerate(program):
+        fused = match(program[index:index + 4])
+        optimized.append(instr if fused is None else fused)
+    code.instructions = optimized
+    return code
@@ -0,0 +1,73 @@
+class Profiler:
+    """Execution counts and wall time of instructions, collected with `--profile`"""
+    def __init__(self, path: str, program: list):
+        self.path = path
+        self.program = program
+        # indexed same as program
+        self.counts = [0] * len(program)
+        self.times = [0.0] * len(program)
+        # label -> number of calls
+        self.calls = {}
+        self.max_depth = 0
+
+    def call(self, label: str, depth: int):
+        self.calls[label] = self.calls.get(label, 0) + 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def report(self) -> dict:
+        opcodes = {}
+        instructions = []
+        for instr, count, time in zip(self.program, self.counts, self.times):
+            if count == 0:
+                continue
+            opcode = opcodes.setdefault(instr.opcode, {"count": 0, "time": 0.0})
+            opcode["count"] += count
+            opcode["time"] += time
+            instructions.append({"order": instr.order, "opcode": instr.opcode, "count": count, "time": time})
+
+        instructions.sort(key=lambda i: i["time"], reverse=True)
+        return {
+            "total_time": sum(self.times),
+            "opcodes": dict(sorted(opcodes.items(), key=lambda i: i[1]["time"], reverse=True)),
+            "instructions": instructions,
+            "calls": dict(sorted(self.calls.items(), key=lambda i: i[1], reverse=True)),
+            "max_call_depth": self.max_depth,
+        }
+
+    @staticmethod
+    def table(report: dict) -> str:
+        lines = ["total time: {:.6f} s, max call depth: {}".format(report["total_time"], report["max_call_depth"]), ""]
+
+        lines.append("{:<21} {:>12} {:>12} {:>8}".format("opcode", "count", "time [s]", "time %"))
+        for opcode, values in report["opcodes"].items():
+            lines.append("{:<21} {:>12} {:>12.6f} {:>8.2f}".format(
+                opcode, values["count"], values["time"], Profiler._percent(values["time"], report["total_time"])))
+
+        lines.append("")
+        lines.append("{:>8} {:<21} {:>12} {:>12} {:>8}".format("order", "opcode", "count", "time [s]", "time %"))
+        for instr in report["instructions"]:
+            lines.append("{:>8} {:<21} {:>12} {:>12.6f} {:>8.2f}".format(
+                instr["order"], instr["opcode"], instr["count"], instr["time"],
+                Profiler._percent(instr["time"], report["total_time"])))
+
+        lines.append("")
+        lines.append("{:<24} {:>12}".format("called label", "calls"))
+        for label, count in report["calls"].items():
+            lines.append("{:<24} {:>12}".format(label, count))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _percent(part: float, total: float) -> float:
+        return part / total * 100 if total > 0 else 0.0
+
+    def write(self):
+        """Writes JSON report to `path` and text table to `path` with `.txt` suffix"""
+        # imported here, so runs without profiler don't pay for it
+        import json
+
+        report = self.report()
+        with open(self.path, "w") as file:
+            json.dump(report, file, indent=2)
+        with open(self.path + ".txt", "w") as file:
+            file.write(Profiler.table(report))
@@ -0,0 +1,70 @@
+import os
+import stat
+
+# number of characters read from input at once
+BLOCK_SIZE = 1 << 20
+
+
+class InputReader:
+    """Line reader for `READ` instruction
+
+    Regular files are read in large blocks and split into lines here, other
+    streams (terminals, pipes) are read line by line so interactive use keeps
+    working. Lines are returned in the same form as from `input()`.
+    """
+    def __init__(self, stream, output=None, block_size: int = BLOCK_SIZE):
+        self.stream = stream
+        # flushed before reading blocks
+        self.output = output
+        self.block_size = block_size if InputReader.is_file(stream) else 0
+        self.lines = []
+        self.index = 0
+        self.rest = []
+        self.eof = False
+
+    @staticmethod
+    def is_file(stream) -> bool:
+        try:
+            return stat.S_ISREG(os.fstat(stream.fileno()).st_mode)
+        except (AttributeError, OSError, ValueError):
+            # in-memory streams have no descriptor, but can be read in blocks
+            return True
+
+    def readline(self):
+        """Returns next line without line break, `None` at the end of input"""
+        if self.index == len(self.lines) and not self._fill():
+            return None
+        line = self.lines[self.index]
+        self.index += 1
+        return line
+
+    def _fill(self) -> bool:
+        self.lines = []
+        self.index = 0
+        while not self.eof:
+            if self.output is not None:
+                self.output.flush()
+
+            if self.block_size == 0:
+                chunk = self.stream.readline()
+            else:
+                chunk = self.stream.read(self.block_size)
+
+            if len(chunk) == 0:
+                self.eof = True
+            elif "\n" not in chunk:
+                # very long line, don't join parts on every block
+                self.rest.append(chunk)
+            else:
+                self.rest.append(chunk)
+                self.lines = "".join(self.rest).split("\n")
+                last = self.lines.pop()
+                self.rest = [last] if len(last) != 0 else []
+                return True
+
+        # last line without line break
+        if len(self.rest) != 0:
+            self.lines = ["".join(self.rest)]
+            self.rest = []
+            return True
+        return False
@@ -0,0 +1,318 @@
+"""Resident interpreter server
+
+Listens on UNIX socket and runs jobs in pool of pre-forked worker processes,
+so every job doesn't pay for interpreter startup and imports. A job is one
+connection: client sends JSON object and shuts down writing, server answers
+with JSON object and closes the connection.
+
+Job: `{"source": "<program XML>", "input": "<program input>", "stats": true, "optimize": true, "stream": true}`,
+only `source` is required.
+
+Result: `{"stdout": "...", "stderr": "...", "rc": 0, "stats": {"insts": 10, "vars": 2}, "memory": 1024}`,
+`stats` is `null` if they were not requested. `memory` is peak memory of the
+job in kilobytes above memory of the worker when the job started, `null` if
+the system doesn't report it (see `JobMemory`). Job running longer than
+`--timeout` gets result with code 99 and its worker is replaced.
+"""
+import io
+import json
+import os
+import re
+import resource
+import signal
+import socket
+import sys
+import traceback
+
+from interpret import *
+
+arg_types = {
+    "help": False,
+    "socket": True,
+    "workers": True,
+    "max-jobs": True,
+    "max-memory": True,
+    "timeout": True,
+    # `None` if the value is optional
+    "cache": None,
+    "no-cache": False,
+}
+
+help_strings = [
+    "IPPcode20 interpreter server (server.py)\n",
+    "Parameters:",
+    "--help           - Prints script manual, exclusive with other arguments",
+    "--socket=PATH    - Path of UNIX socket to listen on, required",
+    "--workers=N      - Number of worker processes, default is number of CPUs",
+    "--max-jobs=N     - Worker is replaced after N jobs, default is 1000",
+    "--max-memory=MB  - Worker is replaced when its memory after a job exceeds MB, default is 512",
+    "--timeout=SEC    - Job running longer is stopped and its worker replaced, default is 60",
+    "--cache[=DIR]    - Decoded programs are stored in DIR, default is $XDG_CACHE_HOME/ipp-interpret",
+    "--no-cache       - Decoded programs are not stored on disk, this is the default\n",
+    "Return codes:",
+    " 0 - Server was stopped by SIGINT or SIGTERM",
+    "10 - Invalid argument or combination of arguments",
+    "11 - Unable to listen on socket",
+]
+
+# size of blocks received from socket
+RECV_SIZE = 1 << 16
+
+
+class ServerOpts:
+    def __init__(self):
+        self.socket = None
+        self.workers = os.cpu_count() or 1
+        self.max_jobs = 1000
+        # in kilobytes, same unit as /proc/self/status and `ru_maxrss`
+        self.max_memory = 512 * 1024
+        # seconds of one job
+        self.timeout = 60.0
+        # directory of decoded programs, `None` if disabled
+        self.cache = None
+
+
+def parse_server_args() -> ServerOpts:
+    args = sys.argv[1:]
+    opts = ServerOpts()
+    no_cache = False
+    arg_format = re.compile(r'^--?([a-zA-Z-]+)(?:$|=([\S]+))$')
+
+    for arg in args:
+        try:
+            name, value = arg_format.findall(arg)[0]
+        except IndexError:
+            Error.ERR_ARGS.exit()
+            return
+
+        if name not in arg_types or (arg_types[name] is not None and arg_types[name] != (len(value) != 0)):
+            Error.ERR_ARGS.exit()
+
+        try:
+            if name == "help":
+                if len(args) != 1:
+                    Error.ERR_ARGS.exit()
+                print("\n".join(help_strings))
+                exit(0)
+            elif name == "socket":
+                opts.socket = value
+            elif name == "workers":
+                opts.workers = int(value)
+            elif name == "max-jobs":
+                opts.max_jobs = int(value)
+            elif name == "max-memory":
+                opts.max_memory = int(value) * 1024
+            elif name == "timeout":
+                opts.timeout = float(value)
+            elif name == "cache":
+                if no_cache:
+                    Error.ERR_ARGS.exit()
+                opts.cache = value or default_cache_directory()
+            elif name == "no-cache":
+                if opts.cache is not None:
+                    Error.ERR_ARGS.exit()
+                no_cache = True
+        except ValueError:
+            Error.ERR_ARGS.exit()
+
+    if opts.socket is None or opts.workers < 1 or opts.max_jobs < 1 or opts.max_memory < 1 \
+            or not opts.timeout > 0:
+        Error.ERR_ARGS.exit()
+    return opts
+
+
+class JobMemory:
+    """Memory of worker process in kilobytes
+
+    Linux can reset peak memory of a process (`/proc/self/clear_refs`), so
+    peak of every job is measured separately. Elsewhere only peak of the
+    whole worker (`ru_maxrss`) is known, so memory of job is not reported
+    and worker is replaced by its peak.
+    """
+    def __init__(self):
+        self.start = None
+
+    @staticmethod
+    def status() -> dict:
+        """Current and peak memory, empty if it is not known"""
+        memory = {}
+        try:
+            with open("/proc/self/status") as file:
+                for line in file:
+                    if line.startswith(("VmRSS:", "VmHWM:")):
+                        memory[line[:5]] = int(line.split()[1])
+        except (OSError, ValueError, IndexError):
+            return {}
+        return memory
+
+    def job_started(self):
+        try:
+            with open("/proc/self/clear_refs", "w") as file:
+                file.write("5")
+        except OSError:
+            self.start = None
+            return
+        self.start = self.status().get("VmRSS")
+
+    def job_peak(self):
+        """Peak memory of job above memory of worker when it started, `None` if it is not known"""
+        peak = self.status().get("VmHWM")
+        if self.start is None or peak is None:
+            return None
+        return max(peak - self.start, 0)
+
+    def current(self) -> int:
+        return self.status().get("VmRSS") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_job(job: dict, cache_directory: str) -> dict:
+    """Runs program in this process with in-memory streams"""
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    stats = Stats(None, [Stat.INSTS, Stat.VARS]) if job.get("stats") else None
+
+    try:
+        rc = run(job["source"], io.StringIO(job.get("input", "")), stdout, stats, stderr, cache_directory,
+                 bool(job.get("optimize")), stream=bool(job.get("stream"))).rc
+    except InterpretError as e:
+        # same message as from command line interpreter
+        eprint("Error: " + e.error.name, file=stderr)
+        rc = e.error.value
+    except Exception:
+        traceback.print_exc(file=stderr)
+        rc = Error.ERR_INTERNAL.value
+
+    return {
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "rc": rc,
+        "stats": None if stats is None else {"insts": stats.insts, "vars": stats.vars},
+    }
+
+
+def receive(conn: socket.socket) -> bytes:
+    chunks = []
+    while True:
+        chunk = conn.recv(RECV_SIZE)
+        if len(chunk) == 0:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def handle(conn: socket.socket, opts: ServerOpts, memory: JobMemory):
+    try:
+        job = json.loads(receive(conn))
+        if not isinstance(job, dict) or not isinstance(job.get("source"), str):
+            raise ValueError("job must be an object with source")
+    except ValueError as e:
+        # invalid JSON is `ValueError` too
+        result = {"stdout": "", "stderr": str(e) + "\n", "rc": Error.ERR_ARGS.value, "stats": None, "memory": None}
+        conn.sendall(json.dumps(result).encode())
+        return
+
+    def expired(signum, frame):
+        # job can be stopped anywhere, so worker is not used again, parent replaces it
+        result = {"stdout": "", "stderr": "Error: job exceeded time limit of {:g} s\n".format(opts.timeout),
+                  "rc": Error.ERR_INTERNAL.value, "stats": None, "memory": memory.job_peak()}
+        try:
+            conn.sendall(json.dumps(result).encode())
+        finally:
+            os._exit(1)
+
+    memory.job_started()
+    signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, opts.timeout)
+    try:
+        result = run_job(job, opts.cache)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    result["memory"] = memory.job_peak()
+    conn.sendall(json.dumps(result).encode())
+
+
+def worker(server: socket.socket, opts: ServerOpts):
+    """Serves jobs until it has run `max_jobs` of them or its memory grows over `max_memory`"""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    memory = JobMemory()
+    jobs = 0
+    while jobs < opts.max_jobs and memory.current() < opts.max_memory:
+        conn, _ = server.accept()
+        with conn:
+            try:
+                handle(conn, opts, memory)
+            except OSError:
+                # client went away
+                pass
+        jobs += 1
+
+
+def spawn(server: socket.socket, opts: ServerOpts) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            worker(server, opts)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            # don't run cleanup of parent process
+            os._exit(code)
+    return pid
+
+
+def serve(opts: ServerOpts):
+    if os.path.exists(opts.socket):
+        os.unlink(opts.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(opts.socket)
+        os.chmod(opts.socket, 0o600)
+        server.listen(128)
+    except OSError:
+        Error.ERR_INPUT.exit()
+
+    workers = set()
+
+    def stop(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        server.close()
+        os.unlink(opts.socket)
+        exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # workers are forked from process with all modules already imported
+    while True:
+        while len(workers) < opts.workers:
+            workers.add(spawn(server, opts))
+        # retired or crashed worker is replaced
+        pid, _ = os.wait()
+        workers.discard(pid)
+
+
+def request(path: str, job: dict, timeout: float = None) -> dict:
+    """Sends job to server listening on `path` and returns its result
+
+    Raises `OSError` if the server is not running and `socket.timeout` if no
+    result comes in `timeout` seconds.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(path)
+        conn.sendall(json.dumps(job).encode())
+        conn.shutdown(socket.SHUT_WR)
+        return json.loads(receive(conn))
+
+
+if __name__ == "__main__":
+    try:
+        serve(parse_server_args())
+    except InterpretError as error:
+        error.exit()
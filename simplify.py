@@ -0,0 +1,151 @@
+"""Static simplification of decoded program, run with `--optimize` before peephole optimizer
+
+- instructions with only constant operands are evaluated once and replaced
+  by `MOVE` of the result, conditional jumps with constant operands become
+  `JUMP` or no-op
+- unreachable instructions are dropped
+- no-ops (`LABEL`, jump to the next instruction, jump which is never taken)
+  are dropped, the following instruction takes over their `weight`, so
+  `--insts` still counts the original program
+
+Instruction that would fail is left unchanged, so it fails at runtime with
+the same error. No-op can only be dropped if the following instruction is
+not a jump target, otherwise jumps to that instruction would count the no-op
+too. Of several labels in a row only the last one is dropped. Labels
+targeted by `CALL` are kept, profiler reports calls by their names.
+"""
+from collections import Counter
+
+from var import VarType
+from instruction import Code, Instruction, opcode_has_target
+
+# instructions whose result depends only on their operands
+PURE_OPCODES = frozenset(("ADD", "SUB", "MUL", "DIV", "IDIV", "LT", "GT", "EQ", "AND", "OR", "NOT", "INT2CHAR",
+                          "STRI2INT", "INT2FLOAT", "FLOAT2INT", "CONCAT", "STRLEN", "GETCHAR", "TYPE"))
+CONDITIONAL_JUMPS = frozenset(("JUMPIFEQ", "JUMPIFNEQ"))
+
+type_names = {
+    VarType.INT: "int",
+    VarType.BOOL: "bool",
+    VarType.STRING: "string",
+    VarType.NIL: "nil",
+    VarType.FLOAT: "float",
+}
+
+
+def constant_operands(instr: Instruction) -> bool:
+    return all(arg_type != "var" for arg_type, _ in instr.args[1:])
+
+
+def fold(program: list, evaluate) -> set:
+    """Replaces instructions with constant operands, returns indices of jumps which are never taken
+
+    `evaluate(instr)` returns result of instruction, for conditional jump
+    whether it is taken, and `None` if the instruction fails.
+    """
+    never_taken = set()
+    for index, instr in enumerate(program):
+        if instr.opcode not in PURE_OPCODES and instr.opcode not in CONDITIONAL_JUMPS:
+            continue
+        if not constant_operands(instr):
+            continue
+        result = evaluate(instr)
+        if result is None:
+            continue
+
+        if instr.opcode in CONDITIONAL_JUMPS:
+            if result:
+                folded = Instruction("JUMP", instr.order, instr.args[:1])
+            else:
+                never_taken.add(index)
+                continue
+        else:
+            folded = Instruction("MOVE", instr.order, (instr.args[0], (type_names[result.var_type], result)))
+        folded.weight = instr.weight
+        program[index] = folded
+    return never_taken
+
+
+def successors(program: list, index: int) -> list:
+    instr = program[index]
+    if instr.opcode == "JUMP":
+        return [instr.args[0][1]]
+    elif instr.opcode in ("RETURN", "EXIT"):
+        return []
+    elif opcode_has_target(instr.opcode):
+        # conditional jump or `CALL`, which returns to the next instruction
+        return [instr.args[0][1], index + 1]
+    return [index + 1]
+
+
+def reachable(program: list) -> list:
+    """Returns for every instruction whether it can be executed"""
+    result = [False] * len(program)
+    pending = [0]
+    while pending:
+        index = pending.pop()
+        if index >= len(program) or result[index]:
+            continue
+        result[index] = True
+        pending.extend(successors(program, index))
+    return result
+
+
+def simplify(code: Code, evaluate) -> Code:
+    program = code.instructions
+    never_taken = fold(program, evaluate)
+    executed = reachable(program)
+
+    # number of executable jumps to every instruction
+    targets = Counter()
+    called = set()
+    for index, instr in enumerate(program):
+        if executed[index] and opcode_has_target(instr.opcode):
+            targets[instr.args[0][1]] += 1
+            if instr.opcode == "CALL":
+                called.add(instr.args[0][1])
+
+    # index of instruction which takes place of dropped no-op
+    moved_to = {}
+    following = None
+    for index in reversed(range(len(program))):
+        if not executed[index]:
+            continue
+        instr = program[index]
+        if following is None:
+            following = index
+            continue
+
+        if instr.opcode == "JUMP":
+            # jump to the next instruction, which is not target of any other jump
+            target = instr.args[0][1]
+            noop = moved_to.get(target, target) == following and targets[following] == 1
+        else:
+            # no-op falls through, so the next instruction can't be target of any jump
+            noop = (instr.opcode == "LABEL" and index not in called) or index in never_taken
+            noop = noop and targets[following] == 0
+
+        if noop:
+            if opcode_has_target(instr.opcode):
+                targets[moved_to.get(instr.args[0][1], instr.args[0][1])] -= 1
+            program[following].weight += instr.weight
+            moved_to[index] = following
+            targets[following] += targets[index]
+        else:
+            following = index
+
+    new_indices = {}
+    simplified = []
+    for index, instr in enumerate(program):
+        if executed[index] and index not in moved_to:
+            new_indices[index] = len(simplified)
+            simplified.append(instr)
+    for index, following in moved_to.items():
+        new_indices[index] = new_indices[following]
+
+    for instr in simplified:
+        if opcode_has_target(instr.opcode):
+            (arg_type, target), *rest = instr.args
+            instr.args = ((arg_type, new_indices[target]), *rest)
+    code.instructions = simplified
+    return code
@@ -0,0 +1,130 @@
+"""Startup benchmark for interpret.py
+
+Measures time from start of interpreter process to the first byte written by
+`WRITE` (program `bench/startup/first_write.xml`, run with `--unbuffered`),
+without cache and with warm cache of decoded programs. Best time is compared
+to baseline stored in `bench/startup/baseline.json`. With `--importtime`,
+breakdown of import times (`python -X importtime`) is printed as well.
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import BenchmarkOpts, Baseline, best_time, common_arg_types, parse_args
+
+arg_types = {
+    **common_arg_types,
+    "importtime": False,
+}
+
+help_strings = [
+    "IPPcode20 interpreter startup benchmark (startup.py)\n",
+    "Parameters:",
+    "--help              - Prints script manual, exclusive with other arguments",
+    "--int-script=PATH   - Path to interpreter, default is interpret.py",
+    "--repeat=N          - Number of runs of each variant, best time is used, default is 20",
+    "--threshold=PERCENT - Slowdown against baseline reported as regression, default is 10",
+    "--importtime        - Prints modules imported by interpreter sorted by cumulative import time",
+    "--update            - Store measured times as new baseline\n",
+    "Return codes:",
+    " 0 - Success, no regressions",
+    " 1 - Startup is slower than baseline or program failed",
+    "10 - Invalid argument or combination of arguments",
+]
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench", "startup")
+PROGRAM = os.path.join(DIRECTORY, "first_write.xml")
+
+# number of modules printed in import breakdown
+IMPORT_ROWS = 25
+
+
+class StartupOpts(BenchmarkOpts):
+    def __init__(self):
+        super().__init__(repeat=20)
+        self.importtime = False
+
+
+def parse_arg(opts: StartupOpts, name: str, value: str):
+    if name == "importtime":
+        opts.importtime = True
+
+
+def environment() -> dict:
+    """Environment of measured runs, bytecode is written so only the first run compiles modules"""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def first_write(command: list) -> float:
+    """Returns seconds from start of `command` to its first output byte, `None` if it failed"""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=environment())
+    first = process.stdout.read(1)
+    elapsed = time.perf_counter() - start
+    process.stdout.read()
+    process.stdout.close()
+    if process.wait() != 0 or len(first) == 0:
+        return None
+    return elapsed
+
+
+def measure(opts: StartupOpts, extra_args: list) -> float:
+    command = [sys.executable, opts.interpret, "--source=" + PROGRAM, "--input=" + os.devnull, "--unbuffered"]
+    return best_time(lambda: first_write(command + extra_args), opts.repeat)
+
+
+def print_imports(opts: StartupOpts, extra_args: list):
+    """Prints modules imported by interpreter with their own and cumulative import time"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", opts.interpret, "--source=" + PROGRAM, "--input=" + os.devnull]
+        + extra_args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=environment()
+    )
+    line_format = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+    modules = []
+    for line in result.stderr.splitlines():
+        match = line_format.match(line)
+        if match is not None:
+            own, cumulative, indent, name = match.groups()
+            modules.append((int(cumulative), int(own), len(indent) // 2, name))
+
+    # modules imported directly by interpreter or startup of python itself have no indentation
+    total = sum(cumulative for cumulative, _, level, _ in modules if level == 0)
+    print("{:<32} {:>10} {:>10}".format("module", "self [ms]", "cumul [ms]"))
+    for cumulative, own, level, name in sorted(modules, reverse=True)[:IMPORT_ROWS]:
+        print("{:<32} {:>10.2f} {:>10.2f}".format("  " * level + name, own / 1000, cumulative / 1000))
+    print("{:<32} {:>10} {:>10.2f}".format("total", "", total / 1000))
+
+
+def main():
+    opts = parse_args(StartupOpts(), arg_types, help_strings, parse_arg)
+    baseline = Baseline(os.path.join(DIRECTORY, "baseline.json"), opts, "startup", "ms", 2)
+
+    cache_directory = tempfile.mkdtemp(prefix="ipp-startup-")
+    try:
+        variants = {
+            "no-cache": ["--no-cache"],
+            # first run of this variant fills the cache
+            "cache": ["--cache=" + cache_directory],
+        }
+
+        for name, extra_args in variants.items():
+            elapsed = measure(opts, extra_args)
+            baseline.report(name, None if elapsed is None else elapsed * 1000)
+
+        if opts.importtime:
+            for name, extra_args in variants.items():
+                print("\nimports with {}:".format(name))
+                print_imports(opts, extra_args)
+    finally:
+        shutil.rmtree(cache_directory, ignore_errors=True)
+    baseline.finish()
+
+
+if __name__ == "__main__":
+    main()
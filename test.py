@@ -0,0 +1,590 @@
+"""IPPcode20 tester, parallel replacement of test.php
+
+Reads the same `.src`/`.in`/`.out`/`.rc` test layout, takes the same
+arguments and prints the same HTML report. Tests run in parallel, outputs
+are compared in memory and every program run has a time limit. Threads are
+used instead of processes, because a test only waits for its parser and
+interpreter subprocesses (or server job) and the GIL is released while
+waiting, so nothing has to be pickled and cores are still used. With
+`--server`, programs are run as jobs of server.py instead of new processes.
+"""
+import html
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from enum import Enum
+
+from html_strings import html_head, html_end, html_table_start
+
+ARG = {
+    "help": False,
+    "directory": True,
+    "recursive": False,
+    "parse-script": True,
+    "int-script": True,
+    "parse-only": False,
+    "int-only": False,
+    "jexamxml": True,
+    "testlist": True,
+    "match": True,
+    "jobs": True,
+    "timeout": True,
+    "json": False,
+    "server": True,
+}
+
+# arguments with value which is not a path
+NOT_PATH = ("match", "jobs", "timeout")
+
+
+class Err:
+    ARG = 10
+    INPUT = 11
+    OUTPUT = 12
+    INTERNAL = 99
+
+
+def return_error(err: int):
+    messages = {
+        Err.ARG: "Invalid argument or combnination of arguments.",
+        Err.INPUT: "Unable to open input file.",
+        Err.OUTPUT: "Unable to open output file.",
+    }
+    sys.stderr.write(messages.get(err, "Internal error."))
+    exit(err if err in messages else Err.INTERNAL)
+
+
+class Variant(Enum):
+    BOTH = 0
+    PARSE_ONLY = 1
+    INT_ONLY = 2
+
+
+class Result(Enum):
+    PASSED = 0
+    WRONG_RC = 1
+    WRONG_OUT = 2
+    TIMEOUT = 3
+
+    def __str__(self):
+        return {
+            Result.PASSED: "Passed",
+            Result.WRONG_RC: "Wrong return code",
+            Result.WRONG_OUT: "Wrong output",
+            Result.TIMEOUT: "Timed out",
+        }[self]
+
+
+class TestResult:
+    def __init__(self, name: str, expected_rc: int):
+        self.name = name
+        self.result = Result.PASSED
+        self.expected_rc = expected_rc
+        self.got_rc = None
+
+
+class TestOpts:
+    def __init__(self):
+        self.test_path = "."
+        self.parser_path = "parse.php"
+        self.interpret_path = "interpret.py"
+        self.xml_test_path = "/pub/courses/ipp/jexamxml/jexamxml.jar"
+        self.test_list = None
+        self.test_regex = None
+        self.recursive_search = False
+        self.variant = Variant.BOTH
+        self.jobs = os.cpu_count() or 1
+        # seconds for one run of parser or interpreter
+        self.timeout = 10.0
+        self.json = False
+        # socket of server.py which runs the programs, see `Commands.exec_job`
+        self.server = None
+
+
+def compile_regex(value: str):
+    """Accepts both plain regex and PHP style `/regex/flags`"""
+    delimited = re.fullmatch(r"([^\w\s\\])(.*)\1([imsx]*)", value, re.DOTALL)
+    flags = 0
+    if delimited is not None:
+        value = delimited.group(2)
+        for flag in delimited.group(3):
+            flags |= {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}[flag]
+    try:
+        return re.compile(value, flags)
+    except re.error:
+        return_error(Err.INPUT)
+
+
+def parse_args() -> TestOpts:
+    args = sys.argv[1:]
+    opts = TestOpts()
+    arg_format = re.compile(r'^-{1,2}([a-zA-Z-]*)($|=(["\'\S./]+))$')
+
+    int_only = False
+    parse_only = False
+    server = False
+    test_list = False
+    directory = False
+
+    for arg in args:
+        # parse arg, split into groups
+        match = arg_format.match(arg)
+        if match is None:
+            return_error(Err.ARG)
+        name, value = match.group(1), match.group(3) or ""
+
+        # discard unknown arguments and check if arg should have value attached
+        if name not in ARG or ARG[name] != (len(match.group(2)) != 0):
+            return_error(Err.ARG)
+
+        if name == "help":
+            # help is exclusive with everything else
+            if len(args) != 1:
+                return_error(Err.ARG)
+            print_help()
+            exit(0)
+        elif name == "directory":
+            if not os.path.isdir(value) or test_list:
+                return_error(Err.ARG)
+            directory = True
+            opts.test_path = value
+        elif name == "recursive":
+            opts.recursive_search = True
+        elif name == "jexamxml":
+            opts.xml_test_path = value
+        elif name == "parse-script":
+            if int_only:
+                return_error(Err.ARG)
+            opts.parser_path = value
+        elif name == "int-script":
+            if parse_only:
+                return_error(Err.ARG)
+            opts.interpret_path = value
+        elif name == "parse-only":
+            if int_only or server:
+                return_error(Err.ARG)
+            parse_only = True
+            opts.variant = Variant.PARSE_ONLY
+        elif name == "int-only":
+            if parse_only:
+                return_error(Err.ARG)
+            int_only = True
+            opts.variant = Variant.INT_ONLY
+        elif name == "testlist":
+            if directory:
+                return_error(Err.ARG)
+            test_list = True
+            opts.test_list = value
+        elif name == "match":
+            opts.test_regex = compile_regex(value)
+        elif name == "jobs":
+            try:
+                opts.jobs = int(value)
+            except ValueError:
+                return_error(Err.ARG)
+            if opts.jobs < 1:
+                return_error(Err.ARG)
+        elif name == "timeout":
+            try:
+                opts.timeout = float(value)
+            except ValueError:
+                return_error(Err.ARG)
+            if opts.timeout <= 0:
+                return_error(Err.ARG)
+        elif name == "json":
+            opts.json = True
+        elif name == "server":
+            if parse_only:
+                return_error(Err.ARG)
+            server = True
+            opts.server = value
+
+        # if path is specified, it must be valid
+        if ARG[name] and name not in NOT_PATH and not os.path.exists(value):
+            return_error(Err.INPUT)
+    return opts
+
+
+def print_help():
+    print("IPPcode20 tester (test.py)\n")
+    print("Runs tests on parser and interpreter in parallel.\n")
+    print("Parameters:")
+    print("--help                  - Prints script manual, exclusive with other arguments")
+    print("--directory=PATH        - Check tests in this directory")
+    print("--recursive             - Tests will be searched recursively")
+    print("--parse-script=FILEPATH - Path to parser")
+    print("--int-script=FILEPATH   - Path to interpret")
+    print("--parse-only            - Only test parser, cannot be used with --int-* args")
+    print("--int-only              - Only test interpret, cannot be used with --parse-* args")
+    print("--jexamxml=FILEPATH     - Path to xml tester")
+    print("--testlist=FILEPATH     - File with tests or directories with tests, exclusive with --directory")
+    print("--match=REGEX           - Only run tests with matching name")
+    print("--jobs=N                - Number of tests run at once, default is number of CPUs")
+    print("--timeout=SECONDS       - Time limit for one run of parser or interpreter, default is 10")
+    print("--json                  - Prints JSON report instead of HTML")
+    print("--server=SOCKET         - Programs are run by server.py listening on SOCKET, cannot be used")
+    print("                          with --parse-only\n")
+    print("Return codes:")
+    print(" 0 - Success")
+    print("10 - Invalid argument or combnination of arguments")
+    print("11 - Unable to open input file")
+    print("12 - Unable to open output file")
+    print("99 - Internal error in the script")
+
+
+def test_scan(path: str) -> list:
+    return [os.path.join(path, entry) for entry in sorted(os.listdir(path))
+            if not os.path.isdir(os.path.join(path, entry)) and re.match(r".+\.src$", entry)]
+
+
+def test_scan_recursive(path: str, tests: list):
+    for entry in sorted(os.listdir(path)):
+        if os.path.isdir(os.path.join(path, entry)):
+            test_scan_recursive(os.path.join(path, entry), tests)
+    tests.extend(test_scan(path))
+
+
+def test_list_scan(path: str, recursive: bool) -> list:
+    try:
+        with open(path) as file:
+            lines = file.readlines()
+    except OSError:
+        return_error(Err.INPUT)
+        return []
+
+    files = []
+    for line in lines:
+        line = line.strip()
+        if not os.path.exists(line):
+            return_error(Err.INPUT)
+        if os.path.isdir(line):
+            if recursive:
+                test_scan_recursive(line, files)
+            else:
+                files.extend(test_scan(line))
+        elif re.search(r"[^\s]\.src$", line):
+            files.append(line)
+    return files
+
+
+class Commands:
+    python = sys.executable
+    php = "php7.4"
+
+    @staticmethod
+    def exec(command: list, stdin: bytes, timeout: float, merge_stderr: bool = False):
+        """Returns `(rc, stdout)`, `None` if command did not finish in time
+
+        With `merge_stderr` standard error output is written to the same pipe as standard output.
+        """
+        try:
+            result = subprocess.run(command, input=stdin, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT if merge_stderr else subprocess.DEVNULL,
+                                    timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return None
+        except OSError:
+            # same return code as from shell when command can't be run
+            return 127, b""
+        return result.returncode, result.stdout
+
+    @staticmethod
+    def exec_interpret(opts: TestOpts, source: bytes, input_path: str, args: list, merge_stderr: bool):
+        # source is passed on standard input, so no temporary file is needed
+        return Commands.exec([Commands.python, opts.interpret_path, "--input=" + input_path] + args, source,
+                             opts.timeout, merge_stderr)
+
+    @staticmethod
+    def exec_interpret_stats(opts: TestOpts, source: bytes, input_path: str, args: list, merge_stderr: bool):
+        """Same as `exec_interpret`, but stats file is written too, returns result and content of the file"""
+        with tempfile.TemporaryDirectory() as directory:
+            stats_path = os.path.join(directory, "stats")
+            result = Commands.exec_interpret(opts, source, input_path, args + ["--stats=" + stats_path],
+                                             merge_stderr)
+            return result, read_optional(stats_path)
+
+    @staticmethod
+    def exec_job(opts: TestOpts, source: bytes, input_path: str, args: list):
+        """Runs program as job of server.py, returns result and stats in the same format as stats file
+
+        Only `--optimize` and `--stream` are taken from `args`, stats are always
+        collected by the server and written in order of `--insts` and `--vars` in `args`.
+        """
+        import socket
+        from server import request
+
+        try:
+            with open(input_path, "rb") as file:
+                job = {"source": source.decode(), "input": file.read().decode(), "stats": True,
+                       "optimize": "--optimize" in args, "stream": "--stream" in args}
+            result = request(opts.server, job, opts.timeout)
+        except socket.timeout:
+            return None, None
+        except OSError:
+            return_error(Err.INPUT)
+            return None, None
+        stats = "".join(str(result["stats"][arg[2:]]) + "\n" for arg in args if arg in ("--insts", "--vars"))
+        return (result["rc"], result["stdout"].encode()), stats.encode()
+
+    @staticmethod
+    def exec_parse(opts: TestOpts, source: bytes):
+        return Commands.exec([Commands.php, opts.parser_path], source, opts.timeout)
+
+    @staticmethod
+    def exec_xmldiff(opts: TestOpts, expected: str, got: bytes) -> bool:
+        """XML can't be compared as text, so jexamxml gets it in temporary file"""
+        with tempfile.TemporaryDirectory() as directory:
+            got_path = os.path.join(directory, "got.xml")
+            with open(got_path, "wb") as file:
+                file.write(got)
+            result = Commands.exec(["java", "-jar", opts.xml_test_path, expected, got_path,
+                                    os.path.join(directory, "diff.xml")], None, opts.timeout)
+        return result is not None and result[0] == 0
+
+
+def read_file(path: str, default: bytes) -> bytes:
+    """Reads test file, missing file is created with `default` content"""
+    try:
+        if not os.path.exists(path):
+            with open(path, "wb") as file:
+                file.write(default)
+        with open(path, "rb") as file:
+            return file.read()
+    except OSError:
+        return_error(Err.INPUT)
+
+
+def read_optional(path: str) -> bytes:
+    """Reads optional test file, `None` if it does not exist"""
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+    except OSError:
+        return_error(Err.INPUT)
+
+
+def run_test(test_path: str, opts: TestOpts) -> TestResult:
+    base = test_path[:-len("src")]
+    input_path = base + "in"
+    read_file(input_path, b"")
+    expected_output = read_file(base + "out", b"")
+    try:
+        rc = int(read_file(base + "rc", b"0").strip() or 0)
+    except ValueError:
+        rc = 0
+
+    test_result = TestResult(test_path, rc)
+    with open(test_path, "rb") as file:
+        source = file.read()
+
+    if opts.variant == Variant.PARSE_ONLY:
+        result = Commands.exec_parse(opts, source)
+        if not check_rc(test_result, result):
+            return test_result
+        if not Commands.exec_xmldiff(opts, base + "out", result[1]):
+            test_result.result = Result.WRONG_OUT
+        return test_result
+
+    if opts.variant == Variant.BOTH:
+        result = Commands.exec_parse(opts, source)
+        if result is None:
+            test_result.result = Result.TIMEOUT
+            return test_result
+        test_result.got_rc = result[0]
+        if result[0] == rc and rc != 0:
+            return test_result
+        # check if test was supposed to fail
+        if result[0] != 0:
+            test_result.result = Result.WRONG_RC
+            return test_result
+        source = result[1]
+
+    # optional files only used by this tester, extra arguments of interpreter, expected
+    # output with standard error output written to the same stream and expected stats file
+    args = read_optional(base + "args")
+    args = [] if args is None else args.decode().split()
+    expected_stats = read_optional(base + "stats")
+    if opts.server is not None:
+        # server returns standard error output separately and has its own cache
+        result, stats = Commands.exec_job(opts, source, input_path, args)
+        return check_result(test_result, result, expected_output, stats, expected_stats)
+
+    merged_output = read_optional(base + "outerr")
+    if merged_output is not None:
+        expected_output = merged_output
+    damaged_image = read_optional(base + "cache")
+    if damaged_image is not None:
+        run_cache_test(test_result, opts, source, input_path, args, expected_output, damaged_image)
+        return test_result
+
+    if expected_stats is not None:
+        result, stats = Commands.exec_interpret_stats(opts, source, input_path, args, merged_output is not None)
+    else:
+        result, stats = Commands.exec_interpret(opts, source, input_path, args, merged_output is not None), None
+    return check_result(test_result, result, expected_output, stats, expected_stats)
+
+
+def check_result(test_result: TestResult, result, expected_output: bytes, stats: bytes,
+                 expected_stats: bytes) -> TestResult:
+    """Compares return code, stats if they are expected, even if program failed, and output"""
+    output_checked = check_rc(test_result, result)
+    if test_result.result != Result.PASSED:
+        return test_result
+    if expected_stats is not None and stats != expected_stats:
+        test_result.result = Result.WRONG_OUT
+    elif output_checked and result[1] != expected_output:
+        test_result.result = Result.WRONG_OUT
+    return test_result
+
+
+def run_cache_test(test_result: TestResult, opts: TestOpts, source: bytes, input_path: str, args: list,
+                   expected_output: bytes, damaged_image: bytes):
+    """Runs program several times with one new cache directory, every run must give the expected result
+
+    The first run stores the program and the second one must load it without
+    storing it again. Then every stored file is overwritten with
+    `damaged_image` and the next run must replace it. At last changed source
+    must not be loaded from cache, it is stored as a new file.
+    """
+    def run(program: bytes) -> bool:
+        result = Commands.exec_interpret(opts, program, input_path, args + ["--cache=" + directory], False)
+        if check_rc(test_result, result) and result[1] != expected_output:
+            test_result.result = Result.WRONG_OUT
+        return test_result.result == Result.PASSED
+
+    def stored() -> dict:
+        # file replaced by another one has different inode
+        return {entry.name: entry.inode() for entry in os.scandir(directory) if entry.is_file()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        if not run(source):
+            return
+        images = stored()
+        if not run(source):
+            return
+        if len(images) == 0 or stored() != images:
+            test_result.result = Result.WRONG_OUT
+            return
+
+        for name in images:
+            with open(os.path.join(directory, name), "wb") as file:
+                file.write(damaged_image)
+        if not run(source):
+            return
+        if stored().keys() != images.keys():
+            test_result.result = Result.WRONG_OUT
+            return
+        for name in images:
+            with open(os.path.join(directory, name), "rb") as file:
+                if file.read() == damaged_image:
+                    test_result.result = Result.WRONG_OUT
+                    return
+
+        # comment after root element doesn't change the program, only its source
+        if run(source + b"\n<!-- changed source -->\n") and len(stored()) <= len(images):
+            test_result.result = Result.WRONG_OUT
+
+
+def check_rc(test_result: TestResult, result) -> bool:
+    """Returns whether output should be compared"""
+    if result is None:
+        test_result.result = Result.TIMEOUT
+        return False
+    test_result.got_rc = result[0]
+    if result[0] != test_result.expected_rc:
+        test_result.result = Result.WRONG_RC
+        return False
+    # test was supposed to fail
+    return result[0] == 0
+
+
+def print_html(opts: TestOpts, tests: list):
+    lines = [html_head]
+    variant = {Variant.BOTH: "Both", Variant.PARSE_ONLY: "Parser", Variant.INT_ONLY: "Interpret"}[opts.variant]
+    lines.append("<p>Testing variant:  " + variant + "</p>")
+    lines.append("<div class='hor'>")
+
+    count = sum(1 for test in tests if test.result == Result.PASSED)
+    percent = " - " if len(tests) == 0 else "{:.2f}".format(count / len(tests) * 100)
+    lines.append("<p> Tests passed:   {}/{}  ({}%)</p>".format(count, len(tests), percent))
+    lines.append("""
+        <p><input type='checkbox' id='filter' onclick='filter()'> Filter passed tests</p>
+    """)
+    lines.append("</div>")
+
+    lines.append(html_table_start)
+    for test in tests:
+        if test.result == Result.PASSED:
+            lines.append("<tr class='row_passed'><td class='table_passed'/>")
+        else:
+            lines.append("<tr><td class='table_failed'/>")
+        lines.append("<td>" + str(test.result) + "</td>")
+        lines.append("<td>" + html.escape(test.name) + "</td>")
+        lines.append("<td align='center'>" + str(test.expected_rc) + "</td>")
+        lines.append("<td align='center'>" + ("" if test.got_rc is None else str(test.got_rc)) + "</td>")
+        lines.append("</tr>")
+    lines.append("</table>")
+    lines.append(html_end)
+    sys.stdout.write("".join(lines))
+
+
+def print_json(tests: list):
+    count = sum(1 for test in tests if test.result == Result.PASSED)
+    json.dump({
+        "passed": count,
+        "total": len(tests),
+        "tests": [{
+            "name": test.name,
+            "result": test.result.name.lower(),
+            "expected_rc": test.expected_rc,
+            "got_rc": test.got_rc,
+        } for test in tests],
+    }, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def main():
+    # check if not running on merlin and swap commands
+    if os.path.exists(os.path.join(os.path.dirname(os.path.abspath(__file__)), "env")):
+        Commands.php = "php"
+
+    opts = parse_args()
+
+    # search for tests
+    if opts.test_list is not None:
+        files = test_list_scan(opts.test_list, opts.recursive_search)
+    elif opts.recursive_search:
+        files = []
+        test_scan_recursive(opts.test_path, files)
+    else:
+        files = test_scan(opts.test_path)
+
+    if opts.test_regex is not None:
+        files = [file for file in files if opts.test_regex.search(os.path.splitext(os.path.basename(file))[0])]
+
+    # tests only wait for their processes, so threads are enough to keep all cores busy
+    tests = [None] * len(files)
+    with ThreadPoolExecutor(max_workers=opts.jobs) as executor:
+        futures = {executor.submit(run_test, file, opts): index for index, file in enumerate(files)}
+        for future in as_completed(futures):
+            test = future.result()
+            tests[futures[future]] = test
+            if test.result != Result.PASSED:
+                sys.stderr.write("running {}...\033[0;31mFAILED\033[0;0;1m\n".format(test.name))
+            else:
+                sys.stderr.write("running {}...\033[0;32mPASSED\033[0;0;1m\n".format(test.name))
+
+    if opts.json:
+        print_json(tests)
+    else:
+        print_html(opts, tests)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,40 @@
 import re
 from enum import Enum
+from functools import lru_cache
 from error import *
 
 
+escape_sequence = re.compile(r"\\([0-9]{3})")
+
+
+def _replace_escape(match) -> str:
+    return chr(int(match.group(1)))
+
+
+# strings up to this length are decoded through cache with many entries, longer ones through cache
+# with a few entries, so the same variable written in a loop is decoded once, but memory stays bounded
+MAX_SHORT_ESCAPES = 256
+
+
 def unescape_string(string):
+    """Replaces `\\xyz` escape sequences with characters, runs in linear time"""
     if string is None:
         return ""
-    i = 0
-    escaped = ""
-    esc = re.compile(r"\\[0-9]{3}")
-    # somewhere, this will horribly fail
-    while i < len(string):
-        match = esc.search(string[i:i+4])
-        if match is not None:
-            escaped += chr(int(string[i+1:i+4]))
-            i += 4
-        else:
-            escaped += string[i]
-            i += 1
-    return escaped
+    # most strings don't contain any escape sequences
+    if "\\" not in string:
+        return string
+    if len(string) > MAX_SHORT_ESCAPES:
+        return _unescape_long(string)
+    return _unescape_short(string)
+
+
+def _unescape(string):
+    return escape_sequence.sub(_replace_escape, string)
+
+
+# python caches hash of `str`, so it is computed only once for every string
+_unescape_short = lru_cache(maxsize=1024)(_unescape)
+_unescape_long = lru_cache(maxsize=4)(_unescape)
 
 
 class VarType(Enum):
@@ -45,7 +61,20 @@ class VarType(Enum):
             Error.ERR_INTERNAL.exit()
 
 
+# integers from this range have shared instances
+SMALL_INT_MIN = -128
+SMALL_INT_MAX = 1024
+
+
 class Var:
+    """Typed value of variable
+
+    Instances are never modified once created, instructions store new ones
+    instead, so they can be shared between variables, data stack and
+    constant pool without copying.
+    """
+    __slots__ = ("var_type", "value")
+
     def __init__(self, var_type: VarType, value):
         self.var_type = var_type
         self.value = value
@@ -53,19 +82,76 @@ class Var:
     def __repr__(self):
         return "VarType={type: " + self.var_type.name + ", value: " + str(self.value) + "}"
 
+    def sequence(self):
+        """Returns string value as indexable sequence of characters"""
+        return self.value
+
+    @staticmethod
+    def of_int(value: int):
+        if SMALL_INT_MIN <= value < SMALL_INT_MAX:
+            return _small_ints[value - SMALL_INT_MIN]
+        return Var(VarType.INT, value)
+
+    @staticmethod
+    def of_bool(value: bool):
+        return Var.TRUE if value else Var.FALSE
+
     @staticmethod
     def from_symbol(var_type, value):
         var_type = VarType.from_str(var_type)
         if var_type == VarType.STRING:
-            value = unescape_string(value)
+            return Var(var_type, unescape_string(value))
         elif var_type == VarType.INT:
-            value = int(value)
+            return Var.of_int(int(value))
         elif var_type == VarType.NIL:
-            value = None
+            return Var.NIL
         elif var_type == VarType.BOOL:
-            value = value == "true"
+            return Var.of_bool(value == "true")
         elif var_type == VarType.FLOAT:
-            value = float.fromhex(value)
+            return Var(var_type, float.fromhex(value))
         else:
             Error.ERR_INTERNAL.exit()
-        return Var(var_type, value)
+
+
+# shared instances
+Var.NIL = Var(VarType.NIL, None)
+Var.TRUE = Var(VarType.BOOL, True)
+Var.FALSE = Var(VarType.BOOL, False)
+# defined variable without value
+Var.UNDEF = Var(VarType.UNDEF, None)
+_small_ints = [Var(VarType.INT, value) for value in range(SMALL_INT_MIN, SMALL_INT_MAX)]
+
+
+class StrVar(Var):
+    """String value backed by mutable list of characters
+
+    Used by `SETCHAR` and by `CONCAT` appending to its first operand, which
+    then modify the list in place instead of building a new string. Reading
+    `value` joins the list once and keeps the result until next change.
+    Instance may be modified only while `shared` is not set, `MOVE` and
+    `PUSHS` set it when they pass the reference on (copy on write).
+    """
+    __slots__ = ("text", "chars", "shared")
+
+    def __init__(self, chars: list):
+        self.var_type = VarType.STRING
+        self.text = None
+        self.chars = chars
+        self.shared = False
+
+    @property
+    def value(self) -> str:
+        if self.text is None:
+            self.text = "".join(self.chars)
+        return self.text
+
+    def sequence(self):
+        return self.chars
+
+    def set_char(self, index: int, char: str):
+        self.chars[index] = char
+        self.text = None
+
+    def append(self, chars):
+        self.chars.extend(chars)
+        self.text = None